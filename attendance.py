@@ -0,0 +1,191 @@
+import os
+import re
+import json
+import array
+import datetime
+import collections
+from protocol import batches, protocol_changes, read_protocols
+
+MAGIC = b"plenumsbot-stats 1\n"
+TIME = re.compile(r"^(\d{1,2}):(\d{2})")
+NUMBER = re.compile(r"^\d+$")
+UNKNOWN = -1
+
+# name and array typecode of every column
+COLUMNS = [
+    ("date", "l"),  # proleptic Gregorian ordinal
+    ("took_place", "b"),
+    ("begin", "h"),  # minutes after midnight
+    ("end", "h"),
+    ("attendees", "h"),
+    ("topics", "h"),
+]
+
+YearStats = collections.namedtuple(
+    "YearStats",
+    "year, meetings, skipped, skip_rate, attendees, duration, topics",
+)
+
+
+def parse_time(value):
+    """ Returns the minutes after midnight of a time like "20:15 Uhr" or UNKNOWN """
+    match = TIME.match(value or "")
+    if not match:
+        return UNKNOWN
+    return int(match.group(1)) * 60 + int(match.group(2))
+
+
+def parse_attendees(value):
+    """ Returns the number of attendees given as number or list of names, or UNKNOWN """
+    value = (value or "").strip()
+    if NUMBER.match(value):
+        return int(value)
+    names = [name for name in re.split(r"[,;]", value) if name.strip()]
+    if len(names) > 1:
+        return len(names)
+    return UNKNOWN
+
+
+def _mean(values):
+    """ Returns the mean of values or None if values is empty """
+    return sum(values) / len(values) if values else None
+
+
+class MeetingStats:
+    def __init__(self, path):
+        """
+        Constructor method for class MeetingStats. The statistics keep one row per
+        protocol with its date, whether it took place, begin, end, number of
+        attendees and number of topics. The rows are stored column by column in
+        compact arrays, both in memory and in the file at path.
+
+        Args:
+            path (str): file the columns are stored in
+        """
+        self.path = path
+        self.pages = []
+        self.versions = []
+        self.columns = {name: array.array(code) for name, code in COLUMNS}
+        if os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        """ Reads the columns from self.path """
+        with open(self.path, "rb") as fh:
+            if fh.readline() != MAGIC:
+                raise ValueError(f"{self.path} is no plenumsbot statistics file")
+            header = json.loads(fh.readline())
+            self.pages = header["pages"]
+            self.versions = header["versions"]
+            for name, code in COLUMNS:
+                self.columns[name] = array.array(code)
+                self.columns[name].fromfile(fh, len(self.pages))
+
+    def save(self):
+        """ Writes the columns to self.path """
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "wb") as fh:
+            fh.write(MAGIC)
+            header = {"pages": self.pages, "versions": self.versions}
+            fh.write(json.dumps(header).encode("utf-8") + b"\n")
+            for name, _ in COLUMNS:
+                self.columns[name].tofile(fh)
+        os.replace(tmp, self.path)
+
+    def sync(self, wiki, namespace, batch_size=50):
+        """
+        Reads the protocols in namespace that changed since the last sync.
+
+        Args:
+            wiki (Wiki): wiki the protocols are stored in
+            namespace (str): DokuWiki namespace in which the protocol pages are located
+            batch_size (int, optional): number of pages fetched per request. Defaults to 50.
+
+        Raises:
+            err: exceptions that occurred while accessing the wiki
+
+        Returns:
+            int: number of protocols read
+        """
+        known = dict(zip(self.pages, self.versions))
+        versions, removed, changed = protocol_changes(wiki, namespace, known)
+        self._remove(removed | (set(changed) & set(known)))
+        for pages in batches(changed, batch_size):
+            for page, date, protocol in read_protocols(wiki, pages):
+                self._append(page, versions[page], date, protocol)
+        if changed:
+            self.save()
+        return len(changed)
+
+    def _append(self, page, version, date, protocol):
+        """ Adds the row of a parsed protocol """
+        self.pages.append(page)
+        self.versions.append(version)
+        row = {
+            "date": datetime.date.fromisoformat(date).toordinal(),
+            "took_place": protocol.took_place,
+            "begin": parse_time(protocol.fields.get("beginn")),
+            "end": parse_time(protocol.fields.get("ende")),
+            "attendees": parse_attendees(protocol.fields.get("teilnehmer")),
+            "topics": sum(
+                1 for section in protocol.sections if section.topic != "Termine"
+            ),
+        }
+        for name, _ in COLUMNS:
+            self.columns[name].append(row[name])
+
+    def _remove(self, pages):
+        """ Removes the rows of the given pages """
+        if not pages:
+            return
+        keep = [index for index, page in enumerate(self.pages) if page not in pages]
+        self.pages = [self.pages[index] for index in keep]
+        self.versions = [self.versions[index] for index in keep]
+        for name, code in COLUMNS:
+            column = self.columns[name]
+            self.columns[name] = array.array(code, (column[index] for index in keep))
+
+    def by_year(self, until=None):
+        """
+        Aggregates the protocols up to the given date per year.
+
+        Args:
+            until (datetime.date, optional): ignore protocols after this date. Defaults to today.
+
+        Returns:
+            list of YearStats: one entry per year, oldest first. The averages of
+            attendees, duration (minutes) and topics only consider plenums that
+            took place and are None if no value is known.
+        """
+        until = (until or datetime.date.today()).toordinal()
+        columns = self.columns
+        years = collections.defaultdict(list)
+        for index, date in enumerate(columns["date"]):
+            if date <= until:
+                years[datetime.date.fromordinal(date).year].append(index)
+        stats = []
+        for year in sorted(years):
+            rows = years[year]
+            held = [index for index in rows if columns["took_place"][index]]
+            attendees = [columns["attendees"][index] for index in held]
+            begin = [columns["begin"][index] for index in held]
+            end = [columns["end"][index] for index in held]
+            # plenums ending after midnight are handled by the modulo
+            durations = [
+                (last - first) % (24 * 60)
+                for first, last in zip(begin, end)
+                if UNKNOWN not in (first, last)
+            ]
+            stats.append(
+                YearStats(
+                    year,
+                    len(held),
+                    len(rows) - len(held),
+                    (len(rows) - len(held)) / len(rows),
+                    _mean([value for value in attendees if value != UNKNOWN]),
+                    _mean(durations),
+                    _mean([columns["topics"][index] for index in held]),
+                )
+            )
+        return stats
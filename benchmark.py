@@ -0,0 +1,479 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import datetime
+import statistics
+import threading
+import tracemalloc
+import socketserver
+from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+
+import metrics
+import settings
+import plenumsbot
+
+# topics, lines per topic, events of the protocols and years of the index page
+SIZES = {
+    "small": (5, 3, 3, 1),
+    "medium": (20, 10, 10, 5),
+    "large": (100, 30, 30, 20),
+    "huge": (500, 60, 100, 50),
+}
+FLOWS = ["draft", "announcement"]
+WORDS = (
+    "Tür Schlüssel Kasse Getränke Putzplan Mitgliedsbeitrag Vortrag Workshop "
+    "Server Drucker Lötstation Spende Werkstatt Küche Beamer Netzwerk"
+).split()
+
+
+class FakeWiki:
+    def __init__(self, latency=0.0):
+        """
+        Constructor method for class FakeWiki. An in-process stand-in for the
+        DokuWiki XML-RPC interface, serving the calls used by plenumsbot.Wiki
+        including system.multicall. Every page keeps all its revisions.
+
+        Args:
+            latency (float, optional): seconds every HTTP request is delayed. Defaults to 0.
+        """
+        self.latency = latency
+        self.pages = {}
+        self.requests = 0
+        self._clock = 1600000000
+        self._lock = threading.Lock()
+        wiki = self
+
+        class Handler(SimpleXMLRPCRequestHandler):
+            rpc_paths = ("/lib/exe/xmlrpc.php",)
+
+            def do_POST(self):
+                with wiki._lock:
+                    wiki.requests += 1
+                time.sleep(wiki.latency)
+                super().do_POST()
+
+        class Server(socketserver.ThreadingMixIn, SimpleXMLRPCServer):
+            daemon_threads = True
+
+        self.server = Server(
+            ("127.0.0.1", 0), Handler, logRequests=False, allow_none=True
+        )
+        for name, function in [
+            ("dokuwiki.getVersion", lambda: "Release 2020-07-29 (benchmark)"),
+            ("dokuwiki.getPagelist", self.get_pagelist),
+            ("wiki.getPage", self.get_page),
+            ("wiki.getPageVersion", self.get_page_version),
+            ("wiki.getPageVersions", self.get_page_versions),
+            ("wiki.getPageInfo", self.get_page_info),
+            ("wiki.putPage", self.put_page),
+        ]:
+            self.server.register_function(function, name)
+        self.server.register_multicall_functions()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        """ Stops the server """
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset(self, pages):
+        """
+        Replaces all pages, each one with a single revision.
+
+        Args:
+            pages (dict): page sources, keyed by page name
+        """
+        with self._lock:
+            self.pages = {}
+            self.requests = 0
+        for page, content in pages.items():
+            self.put_page(page, content, {})
+
+    def put_page(self, page, content, options):
+        with self._lock:
+            self._clock += 1
+            self.pages.setdefault(page, []).append((self._clock, content))
+        return True
+
+    def get_page(self, page):
+        revisions = self.pages.get(page)
+        return revisions[-1][1] if revisions else ""
+
+    def get_page_version(self, page, version):
+        for revision, content in self.pages.get(page, []):
+            if revision == version:
+                return content
+        return ""
+
+    def get_page_versions(self, page, offset=0):
+        # like DokuWiki, the current revision isn't part of the history
+        return [
+            {"version": revision, "user": "benchmark", "sum": ""}
+            for revision, _ in reversed(self.pages.get(page, [])[:-1])
+        ][offset:]
+
+    def get_page_info(self, page):
+        revisions = self.pages.get(page)
+        if not revisions:
+            return {}
+        return {"name": page, "version": revisions[-1][0], "author": "benchmark"}
+
+    def get_pagelist(self, namespace, options):
+        return [
+            {
+                "id": page,
+                "rev": revisions[-1][0],
+                "mtime": revisions[-1][0],
+                "size": len(revisions[-1][1]),
+            }
+            for page, revisions in self.pages.items()
+            if page.startswith(namespace + ":")
+        ]
+
+
+class SmtpSink:
+    def __init__(self, latency=0.0):
+        """
+        Constructor method for class SmtpSink. A local SMTP server accepting
+        any login and keeping all received mails in memory.
+
+        Args:
+            latency (float, optional): seconds the reply to every mail is delayed. Defaults to 0.
+        """
+        self.latency = latency
+        self.messages = []
+        sink = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, text):
+                self.wfile.write(text.encode("ascii") + b"\r\n")
+
+            def handle(self):
+                self.reply("220 benchmark ESMTP")
+                for line in self.rfile:
+                    command = line.decode("ascii", "replace").strip().upper()
+                    if command.startswith("EHLO"):
+                        self.reply("250-benchmark\r\n250 AUTH PLAIN LOGIN")
+                    elif command.startswith("AUTH LOGIN"):
+                        self.reply("334 VXNlcm5hbWU6")
+                        self.rfile.readline()
+                        self.reply("334 UGFzc3dvcmQ6")
+                        self.rfile.readline()
+                        self.reply("235 authenticated")
+                    elif command.startswith("AUTH"):
+                        self.reply("235 authenticated")
+                    elif command == "DATA":
+                        self.reply("354 end with <CRLF>.<CRLF>")
+                        data = []
+                        for data_line in self.rfile:
+                            if data_line == b".\r\n":
+                                break
+                            data.append(data_line)
+                        sink.messages.append(b"".join(data))
+                        time.sleep(sink.latency)
+                        self.reply("250 queued")
+                    elif command == "QUIT":
+                        self.reply("221 bye")
+                        return
+                    elif command[:4] in ("HELO", "MAIL", "RCPT", "RSET", "NOOP"):
+                        self.reply("250 ok")
+                    else:
+                        self.reply("502 not implemented")
+
+        class Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        self.server = Server(("127.0.0.1", 0), Handler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        """ Stops the server """
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def synthetic_protocol(topics, lines, events, date, took_place=False, seed=0):
+    """
+    Returns a protocol in the format of template_plenum.j2.
+
+    Args:
+        topics (int): number of topic sections
+        lines (int): number of lines per topic
+        events (int): number of entries below "Termine"
+        date (datetime.date): date of the plenum, the events take place after it
+        took_place (bool, optional): fill in the end time. Defaults to False.
+        seed (int, optional): seed of the random text. Defaults to 0.
+
+    Returns:
+        str: DokuWiki source of the protocol
+    """
+    rnd = random.Random(seed)
+    parts = [
+        f"====== Plenum am Donnerstag, den {date:%Y-%m-%d} ======",
+        "",
+        "Beginn: 20:00 Uhr" if took_place else "Beginn: 20:xx Uhr",
+        "",
+        "Teilnehmer: 12" if took_place else "Teilnehmer: xx",
+        "",
+    ]
+    for topic in range(topics):
+        parts.append(f"===== {rnd.choice(WORDS)} {topic} =====")
+        parts.append("")
+        for _ in range(lines):
+            text = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(4, 16)))
+            parts.append(f"  * {text} /nick{rnd.randint(1, 30)}")
+        parts.append("")
+    parts.append("===== Termine =====")
+    for _ in range(events):
+        day = date + datetime.timedelta(rnd.randint(-30, 120))
+        parts.append(f"  * {day:%Y-%m-%d} {rnd.choice(WORDS)} {rnd.choice(WORDS)}")
+    parts.append("")
+    parts.append("Ende: 21:30 Uhr" if took_place else "Ende: 20:xx Uhr")
+    return "\n".join(parts)
+
+
+def synthetic_index(namespace, years, last_date):
+    """
+    Returns an index page listing one protocol per week for several years.
+
+    Args:
+        namespace (str): DokuWiki namespace of the protocols
+        years (int): number of year sections
+        last_date (datetime.date): date of the newest listed protocol
+
+    Returns:
+        str: DokuWiki source of the index page
+    """
+    parts = ["====== Protokolle ======", ""]
+    date = last_date
+    for year in range(last_date.year, last_date.year - years, -1):
+        parts.append(f"===== {year} =====")
+        parts.append("")
+        while date.year == year:
+            parts.append(f"  * [[{namespace}:{date:%Y-%m-%d}]]")
+            date -= datetime.timedelta(7)
+        parts.append("")
+    return "\n".join(parts)
+
+
+def flow_config(wiki, sink, owndir):
+    """ Returns the plenum configuration pointing to the stand-ins """
+    values = {
+        "wiki_url": wiki.url,
+        "wiki_user": "benchmark",
+        "wiki_password": "benchmark",
+        "wiki_nice_url": "none",
+        "namespace": "bench:plenum",
+        "indexpage": "bench:plenum",
+        "redirectpage": "bench:plenum:themensammlung",
+        "plenum_day_of_week": 3,
+        "mail_server": "127.0.0.1",
+        "mail_port": sink.port,
+        "mail_user": "benchmark",
+        "mail_password": "benchmark",
+        "mail_tls": False,
+        "mail_from": "Plenumsbot <bot@example.com>",
+        "mail_recipient": "Liste <liste@example.com>",
+    }
+    return settings.Settings(values, owndir)
+
+
+def seed_wiki(wiki, config, owndir, size):
+    """ Fills the wiki with the pages read by the draft and announcement flows """
+    topics, lines, events, years = SIZES[size]
+    plenum = plenumsbot.create_plenum(config, owndir)
+    namespace = config.namespace
+    wiki.reset(
+        {
+            plenum.last_page: synthetic_protocol(
+                topics, lines, events, plenum.last_date, seed=1
+            ),
+            plenum.next_page: synthetic_protocol(
+                topics, lines, events, plenum.next_date, seed=2
+            ),
+            config.indexpage: synthetic_index(
+                namespace,
+                years,
+                plenum.last_date - datetime.timedelta(7),
+            ),
+        }
+    )
+
+
+def run_flow(flow, config, owndir):
+    """ Runs the draft or announcement job once, like a run from cron """
+    mails = plenumsbot.MailPool()
+    try:
+        plenumsbot.run_plenum(
+            config,
+            owndir,
+            plenumsbot.WikiPool(),
+            mails,
+            announcement=flow == "announcement",
+        )
+    finally:
+        mails.close()
+
+
+def measure(flow, size, wiki, sink, owndir, repeat):
+    """
+    Measures a flow against the stand-ins.
+
+    Args:
+        flow (str): "draft" or "announcement"
+        size (str): key of SIZES
+        wiki (FakeWiki): wiki stand-in
+        sink (SmtpSink): mail server stand-in
+        owndir (str): directory containing the templates
+        repeat (int): number of timed runs
+
+    Returns:
+        dict: median and minimum seconds, peak memory in bytes, median requests
+        to the wiki and the median seconds per instrumented operation
+    """
+    config = flow_config(wiki, sink, owndir)
+    # warm up, compiles the templates
+    seed_wiki(wiki, config, owndir, size)
+    run_flow(flow, config, owndir)
+    timings = []
+    requests = []
+    stages = {}
+    for _ in range(repeat):
+        seed_wiki(wiki, config, owndir, size)
+        metrics.registry = metrics.Metrics()
+        start = time.perf_counter()
+        run_flow(flow, config, owndir)
+        timings.append(time.perf_counter() - start)
+        requests.append(wiki.requests)
+        for stage, seconds in metrics.registry.seconds.items():
+            stages.setdefault(stage, []).append(seconds)
+    # tracing slows the run down, so memory is measured in a separate run
+    seed_wiki(wiki, config, owndir, size)
+    tracemalloc.start()
+    run_flow(flow, config, owndir)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    metrics.registry = metrics.Metrics()
+    return {
+        "seconds": statistics.median(timings),
+        "min_seconds": min(timings),
+        "peak_bytes": peak,
+        "requests": statistics.median(requests),
+        "stages": {
+            stage: statistics.median(values) for stage, values in sorted(stages.items())
+        },
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compares the results against a baseline.
+
+    Args:
+        results (dict): results of measure(), keyed by "flow/size"
+        baseline (dict): results of an earlier run, same format
+        tolerance (float): allowed relative slowdown, e.g. 0.25 for 25 %
+
+    Returns:
+        list of str: the benchmarks slower than the baseline allows
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]["seconds"]
+        ratio = result["seconds"] / before if before else 1.0
+        memory = result["peak_bytes"] / max(baseline[name]["peak_bytes"], 1)
+        print(f"{name:24} {ratio:6.2f}x time  {memory:6.2f}x memory")
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the draft and announcement flows against a local "
+        "DokuWiki and SMTP stand-in"
+    )
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        choices=list(SIZES),
+        default=["small", "medium", "large"],
+        help="Sizes of the synthetic protocols and index pages. Defaults to small medium large.",
+    )
+    parser.add_argument(
+        "--flows",
+        nargs="+",
+        choices=FLOWS,
+        default=FLOWS,
+        help="Flows to measure. Defaults to all.",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=20,
+        help="Delay of every wiki request and every mail in milliseconds. Defaults to 20.",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Number of timed runs. Defaults to 5."
+    )
+    parser.add_argument(
+        "--stages",
+        action="store_true",
+        help="Also prints the time spent per wiki, mail and template operation.",
+    )
+    parser.add_argument("--save-baseline", metavar="FILE", help="Stores the results.")
+    parser.add_argument(
+        "--baseline",
+        metavar="FILE",
+        help="Compares the results with a stored baseline and fails on regressions.",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed slowdown against the baseline. Defaults to 0.25 (25 %%).",
+    )
+    arguments = parser.parse_args()
+
+    owndir = os.path.dirname(os.path.realpath(__file__))
+    wiki = FakeWiki(arguments.latency / 1000)
+    sink = SmtpSink(arguments.latency / 1000)
+    results = {}
+    print(f"{'benchmark':24} {'median':>9} {'min':>9} {'peak':>10} {'requests':>8}")
+    try:
+        for flow in arguments.flows:
+            for size in arguments.sizes:
+                name = f"{flow}/{size}"
+                result = measure(flow, size, wiki, sink, owndir, arguments.repeat)
+                results[name] = result
+                print(
+                    f"{name:24} {result['seconds'] * 1000:7.1f}ms"
+                    f" {result['min_seconds'] * 1000:7.1f}ms"
+                    f" {result['peak_bytes'] / 1024:8.0f}KiB {result['requests']:8.0f}"
+                )
+                if arguments.stages:
+                    for stage, seconds in result["stages"].items():
+                        print(f"    {stage:28} {seconds * 1000:9.2f}ms")
+    finally:
+        wiki.close()
+        sink.close()
+    if arguments.save_baseline:
+        with open(arguments.save_baseline, "w") as fh:
+            json.dump(results, fh, indent=4, sort_keys=True)
+    if arguments.baseline:
+        with open(arguments.baseline) as fh:
+            baseline = json.load(fh)
+        regressions = compare(results, baseline, arguments.tolerance)
+        if regressions:
+            print(f"slower than the baseline: {', '.join(regressions)}")
+            sys.exit(1)
@@ -0,0 +1,115 @@
+import re
+import collections
+
+LINK = re.compile(r"\[\[\s*([^\]|]*?)\s*(?:\|\s*([^\]]*?)\s*)?\]\]")
+# bold, italic (not the slashes of an url), underlined and monospaced text
+FORMATTING = re.compile(r"\*\*(.+?)\*\*|(?<!:)//(.+?)(?<!:)//|__(.+?)__|''(.+?)''")
+LIST_ITEM = re.compile(r"^\s*[*-]\s+")
+
+Entry = collections.namedtuple("Entry", "topic, items, preview, truncated")
+Digest = collections.namedtuple("Digest", "entries, topics, items, truncated")
+
+
+def plain_text(line):
+    """
+    Returns a line of DokuWiki source without markup. Links are replaced by their
+    label, list items start with "- ".
+
+    Args:
+        line (str): line of DokuWiki source
+
+    Returns:
+        str: the line as plain text
+    """
+    line = LINK.sub(lambda link: link.group(2) or link.group(1), line)
+    line = FORMATTING.sub(lambda match: next(g for g in match.groups() if g), line)
+    if LIST_ITEM.match(line):
+        return LIST_ITEM.sub("- ", line)
+    return line.strip()
+
+
+def build_digest(
+    sections, preview_lines=5, line_length=200, max_size=20000, max_topics=None
+):
+    """
+    Summarizes the topics of a protocol for the announcement. Every topic is
+    listed with its number of entries and a preview of its first lines. Once
+    the previews reach max_size characters, the remaining topics are listed
+    without preview.
+
+    Args:
+        sections (list of Section): sections of the protocol, "Termine" is skipped
+        preview_lines (int, optional): maximum lines previewed per topic. Defaults to 5.
+        line_length (int, optional): maximum characters per previewed line. Defaults to 200.
+        max_size (int, optional): maximum characters of all previews. Defaults to 20000.
+        max_topics (int, optional): maximum topics listed. Defaults to None (all).
+
+    Returns:
+        Digest: the entries, the number of topics and of all their entries and
+        whether any preview was shortened or topics were left out
+    """
+    entries = []
+    size = 0
+    topics = 0
+    items = 0
+    for topic, contents in sections:
+        if topic == "Termine":
+            continue
+        lines = [line for line in contents.splitlines() if line.strip()]
+        count = sum(1 for line in lines if LIST_ITEM.match(line))
+        topics += 1
+        items += count
+        if max_topics is not None and len(entries) >= max_topics:
+            continue
+        preview = []
+        truncated = False
+        for line in lines[:preview_lines]:
+            line = plain_text(line)
+            if len(line) > line_length:
+                line = line[: line_length - 1].rstrip() + "…"
+                truncated = True
+            if size + len(line) > max_size:
+                break
+            size += len(line)
+            preview.append(line)
+        truncated = truncated or len(preview) < len(lines)
+        entries.append(Entry(topic, count, preview, truncated))
+    return Digest(
+        entries,
+        topics,
+        items,
+        len(entries) < topics or any(entry.truncated for entry in entries),
+    )
+
+
+def fit_digest(sections, render, max_size, preview_lines=5, line_length=200):
+    """
+    Returns the most detailed digest whose rendered mail fits into max_size
+    bytes. The previews are shortened first, then topics are left out. Only
+    the events and the fixed text of the mail may exceed the limit.
+
+    Args:
+        sections (list of Section): sections of the protocol, "Termine" is skipped
+        render (callable): returns the parts of the mail (str) for a Digest
+        max_size (int): maximum size of all parts in bytes, encoded as UTF-8
+        preview_lines (int, optional): maximum lines previewed per topic. Defaults to 5.
+        line_length (int, optional): maximum characters per previewed line. Defaults to 200.
+
+    Returns:
+        tuple: the Digest and the parts rendered for it
+    """
+    budget = max_size
+    max_topics = None
+    while True:
+        digest = build_digest(sections, preview_lines, line_length, budget, max_topics)
+        parts = render(digest)
+        size = sum(len(part.encode("utf-8")) for part in parts)
+        if size <= max_size or (budget == 0 and not digest.entries):
+            return digest, parts
+        if budget > 0:
+            used = sum(len(line) for entry in digest.entries for line in entry.preview)
+            # shrinks the previews in proportion, the fixed text makes this converge
+            budget = max(0, min(used - 1, used * max_size // size))
+        else:
+            topics = len(digest.entries)
+            max_topics = min(topics - 1, topics * max_size // size)
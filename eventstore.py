@@ -0,0 +1,204 @@
+import sqlite3
+import hashlib
+import datetime
+from protocol import Event, batches, protocol_changes, read_protocols
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (page TEXT PRIMARY KEY, namespace TEXT, version INTEGER);
+CREATE TABLE IF NOT EXISTS events (page TEXT, namespace TEXT, date TEXT, description TEXT);
+CREATE INDEX IF NOT EXISTS pages_namespace ON pages (namespace, page);
+CREATE INDEX IF NOT EXISTS events_date ON events (namespace, date);
+CREATE INDEX IF NOT EXISTS events_page ON events (page);
+"""
+# stores of older versions are rebuilt from the wiki
+SCHEMA_VERSION = 2
+
+
+class EventStore:
+    def __init__(self, path):
+        """
+        Constructor method for class EventStore. The store keeps the events listed
+        in the section "Termine" of every protocol in a SQLite database. It
+        remembers the revision every protocol was read in, so a sync only
+        downloads and parses the protocols changed since the last sync. Several
+        plenums can share one store, the protocols are kept per namespace.
+
+        Args:
+            path (str): file name of the SQLite database
+        """
+        self.db = sqlite3.connect(path)
+        if self.db.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            self.db.executescript(
+                "DROP TABLE IF EXISTS pages; DROP TABLE IF EXISTS events;"
+            )
+            self.db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        """ Closes the database """
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def sync(self, wiki, namespace, batch_size=50):
+        """
+        Reads the events of all protocols in namespace that changed since the last sync.
+
+        Args:
+            wiki (Wiki): wiki the protocols are stored in
+            namespace (str): DokuWiki namespace in which the protocol pages are located
+            batch_size (int, optional): number of pages fetched per request. Defaults to 50.
+
+        Raises:
+            err: exceptions that occurred while accessing the wiki
+
+        Returns:
+            int: number of protocols read
+        """
+        known = dict(
+            self.db.execute(
+                "SELECT page, version FROM pages WHERE namespace = ?", (namespace,)
+            )
+        )
+        versions, removed, changed = protocol_changes(wiki, namespace, known)
+        with self.db:
+            for page in removed:
+                self._forget(page, namespace)
+            for pages in batches(changed, batch_size):
+                for page, _, protocol in read_protocols(wiki, pages):
+                    self._forget(page, namespace)
+                    self.db.executemany(
+                        "INSERT INTO events VALUES (?, ?, ?, ?)",
+                        [
+                            (page, namespace, event.date, event.description.strip())
+                            for event in protocol.events
+                        ],
+                    )
+                    self.db.execute(
+                        "INSERT INTO pages VALUES (?, ?, ?)",
+                        (page, namespace, versions[page]),
+                    )
+        return len(changed)
+
+    def _forget(self, page, namespace):
+        """ Removes a protocol and its events from the store """
+        self.db.execute(
+            "DELETE FROM events WHERE page = ? AND namespace = ?", (page, namespace)
+        )
+        self.db.execute(
+            "DELETE FROM pages WHERE page = ? AND namespace = ?", (page, namespace)
+        )
+
+    def between(self, namespace, first=None, last=None):
+        """
+        Returns all events of the protocols in namespace from first to last, both
+        included. Events listed in several protocols are returned only once.
+
+        The events of a date are taken from the newest protocol written on or
+        before that date, so events removed from the list don't come back from
+        older protocols. Events older than every protocol are kept as listed.
+
+        Args:
+            namespace (str): DokuWiki namespace in which the protocol pages are located
+            first (datetime.date, optional): first date of the period. Defaults to None (no limit).
+            last (datetime.date, optional): last date of the period. Defaults to None (no limit).
+
+        Returns:
+            list of Event: events ordered by date
+        """
+        first = first.strftime("%Y-%m-%d") if first else "0000-00-00"
+        last = last.strftime("%Y-%m-%d") if last else "9999-99-99"
+        # protocol pages are named namespace:YYYY-MM-DD, so names sort by date
+        rows = self.db.execute(
+            "SELECT DISTINCT date, description FROM events AS event "
+            "WHERE namespace = ? AND date BETWEEN ? AND ? AND page = COALESCE("
+            "    (SELECT MAX(page) FROM pages WHERE namespace = event.namespace"
+            "     AND page <= event.namespace || ':' || event.date),"
+            "    page"
+            ") ORDER BY date, description",
+            (namespace, first, last),
+        )
+        return [Event(date, f" {description}") for date, description in rows]
+
+    def upcoming(self, namespace, date):
+        """
+        Returns the events of the protocols in namespace after the given date.
+
+        Args:
+            namespace (str): DokuWiki namespace in which the protocol pages are located
+            date (datetime.date): events on or before this date are dropped
+
+        Returns:
+            list of Event: events ordered by date
+        """
+        return self.between(namespace, date + datetime.timedelta(1))
+
+    def export_ics(self, namespace, first=None, name="Plenum"):
+        """
+        Returns all events of the protocols in namespace from first on as
+        iCalendar (RFC 5545) feed.
+
+        Args:
+            namespace (str): DokuWiki namespace in which the protocol pages are located
+            first (datetime.date, optional): first date exported. Defaults to None (all events).
+            name (str, optional): name of the calendar. Defaults to "Plenum".
+
+        Returns:
+            str: the iCalendar feed
+        """
+        stamp = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+        lines = [
+            "BEGIN:VCALENDAR",
+            "VERSION:2.0",
+            "PRODID:-//plenumsbot//events//DE",
+            f"X-WR-CALNAME:{_ics_escape(name)}",
+        ]
+        for event in self.between(namespace, first=first):
+            try:
+                date = datetime.datetime.strptime(event.date, "%Y-%m-%d").date()
+            except ValueError:
+                continue
+            description = event.description.strip()
+            uid = hashlib.sha1(f"{event.date} {description}".encode("utf-8"))
+            lines += [
+                "BEGIN:VEVENT",
+                f"UID:{uid.hexdigest()}@plenumsbot",
+                f"DTSTAMP:{stamp}",
+                f"DTSTART;VALUE=DATE:{date.strftime('%Y%m%d')}",
+                f"DTEND;VALUE=DATE:{(date + datetime.timedelta(1)).strftime('%Y%m%d')}",
+                f"SUMMARY:{_ics_escape(description)}",
+                "END:VEVENT",
+            ]
+        lines.append("END:VCALENDAR")
+        return "".join(_ics_fold(line) + "\r\n" for line in lines)
+
+
+def _ics_escape(text):
+    """ Escapes text for use in an iCalendar property value """
+    return (
+        text.replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\n", "\\n")
+    )
+
+
+def _ics_fold(line, limit=75):
+    """ Folds a content line into lines of at most limit octets """
+    encoded = line.encode("utf-8")
+    if len(encoded) <= limit:
+        return line
+    parts = []
+    while encoded:
+        # continuation lines start with a space, which counts against the limit
+        size = limit if not parts else limit - 1
+        # don't split multibyte characters
+        while size < len(encoded) and (encoded[size] & 0xC0) == 0x80:
+            size -= 1
+        parts.append(encoded[:size].decode("utf-8"))
+        encoded = encoded[size:]
+    return "\r\n ".join(parts)
@@ -0,0 +1,144 @@
+import re
+
+PROTOCOLS_HEADING = "====== Protokolle ======"
+YEAR_HEADING = re.compile(r"^={5}\s*(\d{4})\s*={5}\s*$")
+LINK = re.compile(r"\[\[\s*:?([^\]|#]+?)\s*(?:[|#][^\]]*)?\]\]")
+ENTRY = re.compile(r"^\s*\*\s*\[\[\s*:?([^\]|#]+?)\s*(?:[|#][^\]]*)?\]\]")
+DATE = re.compile(r"(\d{4}-\d{2}-\d{2})$")
+
+
+def sort_key(page):
+    """ Returns the key protocol pages are sorted by, the date in their name if any """
+    match = DATE.search(page)
+    return match.group(1) if match else page
+
+
+class IndexPage:
+    def __init__(self, text):
+        """
+        Constructor method for class IndexPage. Parses the page listing all
+        protocols. The page consists of a head followed by one section per year,
+        each starting with a heading like "===== 2020 =====". The entries of a year
+        are sorted from the newest to the oldest protocol, years likewise.
+
+        Args:
+            text (str): plaintext of the indexpage (DokuWiki source)
+        """
+        self.original = text
+        self.changed = False
+        self.head = []
+        # list of [year, lines], the lines start with the heading of the year
+        self.sections = []
+        for line in text.split("\n"):
+            year = YEAR_HEADING.match(line)
+            if year:
+                self.sections.append([int(year.group(1)), [line]])
+            elif self.sections:
+                self.sections[-1][1].append(line)
+            else:
+                self.head.append(line)
+        self.pages = {link.strip() for link in LINK.findall(text)}
+
+    def __contains__(self, page):
+        return page.lstrip(":") in self.pages
+
+    def text(self):
+        """
+        Returns the DokuWiki source of the page. The source is identical to the
+        parsed text if no entry was added.
+
+        Returns:
+            str: plaintext of the indexpage (DokuWiki source)
+        """
+        if not self.changed:
+            return self.original
+        lines = list(self.head)
+        for _, section in self.sections:
+            lines.extend(section)
+        return "\n".join(lines)
+
+    def add(self, page, date):
+        """
+        Adds a protocol to the list, unless it is already listed.
+
+        Args:
+            page (str): name of the protocol page
+            date (datetime.date): date of the plenum, selects the year section
+
+        Returns:
+            bool: True if the page was added
+        """
+        return self.add_many([(page, date)]) == 1
+
+    def add_many(self, entries):
+        """
+        Adds several protocols to the list, keeping the sorting. Pages already
+        listed are skipped. Every year section is rewritten at most once.
+
+        Args:
+            entries (list of tuple): name of the protocol page and datetime.date of the plenum
+
+        Returns:
+            int: number of pages added
+        """
+        by_year = {}
+        for page, date in entries:
+            page = page.lstrip(":")
+            if page in self.pages:
+                continue
+            self.pages.add(page)
+            by_year.setdefault(date.year, []).append(page)
+        for year, pages in by_year.items():
+            pages.sort(key=sort_key, reverse=True)
+            self._merge(self._section(year), pages)
+        if by_year:
+            self.changed = True
+        return sum(len(pages) for pages in by_year.values())
+
+    def _section(self, year):
+        """ Returns the lines of the section of year, creating the section if needed """
+        for existing, lines in self.sections:
+            if existing == year:
+                return lines
+        heading = f"===== {year} ====="
+        for index, (existing, _) in enumerate(self.sections):
+            if existing < year:
+                self.sections.insert(index, [year, [heading, ""]])
+                return self.sections[index][1]
+        if self.sections:
+            self.sections.append([year, [heading, ""]])
+            return self.sections[-1][1]
+        # first year section, everything after the protocols heading follows it
+        if PROTOCOLS_HEADING in self.head:
+            split = self.head.index(PROTOCOLS_HEADING) + 1
+        else:
+            split = 0
+        self.sections.append([year, [heading] + self.head[split:]])
+        self.head = self.head[:split]
+        return self.sections[-1][1]
+
+    @staticmethod
+    def _merge(lines, pages):
+        """
+        Inserts the entries of pages into the lines of a year section.
+
+        Args:
+            lines (list of str): lines of the section, starting with its heading
+            pages (list of str): pages to insert, sorted from newest to oldest
+        """
+        merged = [lines[0]]
+        # position after the last entry, new entries older than all listed ones go there
+        after_entries = 1
+        pending = list(pages)
+        for line in lines[1:]:
+            entry = ENTRY.match(line)
+            if entry:
+                key = sort_key(entry.group(1).strip())
+                while pending and sort_key(pending[0]) > key:
+                    merged.append(f"  * [[{pending.pop(0)}]]")
+                merged.append(line)
+                after_entries = len(merged)
+            else:
+                merged.append(line)
+        merged[after_entries:after_entries] = [f"  * [[{page}]]" for page in pending]
+        lines[:] = merged
@@ -0,0 +1,308 @@
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+import functools
+import contextlib
+import collections
+
+
+class Metrics:
+    def __init__(self):
+        """
+        Constructor method for class Metrics. Collects the duration, payload size
+        and outcome of every instrumented operation ("stage") and counters like
+        retries and cache hits. Every observation can be written as JSON line to
+        a log, the totals are written as Prometheus textfile collector file.
+        """
+        self.log = None
+        self.textfile = None
+        self.seconds = collections.defaultdict(float)
+        self.calls = collections.Counter()
+        self.bytes = collections.Counter()
+        self.errors = collections.Counter()
+        self.counters = collections.Counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def configure(self, log=None, textfile=None):
+        """
+        Sets the outputs of the metrics.
+
+        Args:
+            log (str, optional): file the JSON lines are appended to, "-" for stderr. Defaults to None (no log).
+            textfile (str, optional): Prometheus textfile written by flush(). Defaults to None.
+        """
+        if self.log not in (None, sys.stderr):
+            self.log.close()
+        if log == "-":
+            self.log = sys.stderr
+        elif log:
+            self.log = open(log, "a", buffering=1, encoding="utf-8")
+        else:
+            self.log = None
+        self.textfile = textfile
+
+    @contextlib.contextmanager
+    def labels(self, **labels):
+        """
+        Adds labels, e.g. the name of the plenum, to all observations of the
+        current thread within the with block. They only appear in the JSON log.
+        """
+        previous = getattr(self._local, "labels", {})
+        self._local.labels = {**previous, **labels}
+        try:
+            yield
+        finally:
+            self._local.labels = previous
+
+    @contextlib.contextmanager
+    def timer(self, stage):
+        """
+        Measures the with block as one observation of stage. The block can set
+        "bytes" and further fields in the yielded dict. An observation within
+        another one of the same component (e.g. "wiki.multicall" within
+        "wiki.get_pages") is only logged, marked as nested, so the totals count
+        the work once.
+
+        Args:
+            stage (str): name of the operation, e.g. "wiki.get_page"
+
+        Yields:
+            dict: fields of the observation
+        """
+        active = getattr(self._local, "stages", ())
+        component = stage.split(".")[0]
+        observation = {}
+        for outer in reversed(active):
+            if outer.split(".")[0] == component:
+                observation["nested"] = outer
+                break
+        self._local.stages = active + (stage,)
+        start = time.perf_counter()
+        try:
+            yield observation
+        except BaseException as err:
+            observation["error"] = type(err).__name__
+            raise
+        finally:
+            self._local.stages = active
+            self.observe(stage, time.perf_counter() - start, **observation)
+
+    def observe(self, stage, seconds, bytes=0, error=None, nested=None, **fields):
+        """
+        Records one observation of stage.
+
+        Args:
+            stage (str): name of the operation
+            seconds (float): duration of the operation
+            bytes (int, optional): size of the transferred payload. Defaults to 0.
+            error (str, optional): name of the exception raised by the operation. Defaults to None.
+            nested (str, optional): stage the operation was part of, it is then
+                left out of the totals. Defaults to None.
+        """
+        if nested is None:
+            with self._lock:
+                self.seconds[stage] += seconds
+                self.calls[stage] += 1
+                self.bytes[stage] += bytes
+                if error:
+                    self.errors[stage] += 1
+        if self.log is not None:
+            entry = {
+                "time": round(time.time(), 3),
+                "stage": stage,
+                "seconds": round(seconds, 6),
+                "bytes": bytes,
+                "ok": error is None,
+                **getattr(self._local, "labels", {}),
+                **fields,
+            }
+            if error:
+                entry["error"] = error
+            if nested:
+                entry["nested"] = nested
+            self._write(entry)
+
+    def count(self, name, value=1):
+        """
+        Increments a counter, e.g. "retries" or "page_cache_hits".
+
+        Args:
+            name (str): name of the counter
+            value (int, optional): increment. Defaults to 1.
+        """
+        if not value:
+            return
+        with self._lock:
+            self.counters[name] += value
+        if self.log is not None:
+            self._write(
+                {
+                    "time": round(time.time(), 3),
+                    "counter": name,
+                    "value": value,
+                    **getattr(self._local, "labels", {}),
+                }
+            )
+
+    def _write(self, entry):
+        """ Appends one JSON line to the log """
+        line = json.dumps(entry, ensure_ascii=False, default=str)
+        with self._lock:
+            self.log.write(line + "\n")
+
+    def prometheus(self):
+        """
+        Returns the totals in the Prometheus text exposition format.
+
+        Returns:
+            str: the metrics
+        """
+        lines = []
+
+        def metric(name, kind, help, values):
+            lines.append(f"# HELP plenumsbot_{name} {help}")
+            lines.append(f"# TYPE plenumsbot_{name} {kind}")
+            lines.extend(values)
+
+        def per_stage(name, values, format="{}"):
+            return [
+                f'plenumsbot_{name}{{stage="{stage}"}} {format.format(values[stage])}'
+                for stage in stages
+            ]
+
+        with self._lock:
+            stages = sorted(self.calls)
+            metric(
+                "stage_seconds",
+                "summary",
+                "Time spent in an operation.",
+                per_stage("stage_seconds_sum", self.seconds, "{:.6f}")
+                + per_stage("stage_seconds_count", self.calls),
+            )
+            metric(
+                "stage_bytes_total",
+                "counter",
+                "Payload transferred by an operation.",
+                per_stage("stage_bytes_total", self.bytes),
+            )
+            metric(
+                "stage_errors_total",
+                "counter",
+                "Operations that raised an exception.",
+                per_stage("stage_errors_total", self.errors),
+            )
+            for name in sorted(self.counters):
+                metric(
+                    f"{name}_total",
+                    "counter",
+                    f"Number of {name.replace('_', ' ')}.",
+                    [f"plenumsbot_{name}_total {self.counters[name]}"],
+                )
+        metric(
+            "last_run_timestamp_seconds",
+            "gauge",
+            "Time the metrics were written.",
+            [f"plenumsbot_last_run_timestamp_seconds {time.time():.0f}"],
+        )
+        return "\n".join(lines) + "\n"
+
+    def flush(self):
+        """ Writes the Prometheus textfile, if configured, replacing it atomically """
+        if not self.textfile:
+            return
+        tmp = f"{self.textfile}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            fh.write(self.prometheus())
+        os.replace(tmp, self.textfile)
+
+
+# metrics of the whole process
+registry = Metrics()
+
+
+def payload_size(value):
+    """ Returns the size in bytes of a str or of all strs in a list or dict """
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, dict):
+        return sum(payload_size(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(payload_size(item) for item in value)
+    return 0
+
+
+def result_size(result, *args, **kwargs):
+    """ Returns the payload size of the result of a call, for use with timed() """
+    return payload_size(result)
+
+
+def argument_size(position, name):
+    """
+    Returns a size function for timed(), that measures an argument of the call.
+
+    Args:
+        position (int): position of the argument, counting self
+        name (str): name of the argument, if passed as keyword
+    """
+
+    def size(result, *args, **kwargs):
+        return payload_size(args[position] if len(args) > position else kwargs[name])
+
+    return size
+
+
+def timed(stage, size=None):
+    """
+    Decorator measuring every call of the decorated function as stage.
+
+    Args:
+        stage (str): name of the operation, e.g. "wiki.get_page"
+        size (callable, optional): returns the payload size in bytes, called with the
+            result followed by the arguments of the call. Defaults to None.
+    """
+
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with registry.timer(stage) as observation:
+                result = function(*args, **kwargs)
+                if size is not None:
+                    observation["bytes"] = size(result, *args, **kwargs)
+            return result
+
+        return wrapper
+
+    return decorate
+
+
+def profile(directory):
+    """
+    Profiles the rest of the run with cProfile and tracemalloc. When the process
+    exits, plenumsbot.prof (readable with pstats) and plenumsbot.tracemalloc
+    (a tracemalloc.Snapshot) are written to directory. cProfile only sees the
+    calling thread, so the work has to run in it, see run_batch().
+
+    Args:
+        directory (str): directory the profiles are written to
+    """
+    import cProfile
+    import tracemalloc
+
+    os.makedirs(directory, exist_ok=True)
+    tracemalloc.start(25)
+    profiler = cProfile.Profile()
+    profiler.enable()
+
+    def stop():
+        profiler.disable()
+        profiler.dump_stats(os.path.join(directory, "plenumsbot.prof"))
+        tracemalloc.take_snapshot().dump(
+            os.path.join(directory, "plenumsbot.tracemalloc")
+        )
+        tracemalloc.stop()
+
+    atexit.register(stop)
@@ -0,0 +1,116 @@
+import os
+import hashlib
+import tempfile
+import threading
+
+
+class PageCache:
+    def __init__(self, directory, max_size=10 * 1024 * 1024):
+        """
+        Constructor method for class PageCache. The cache stores page sources on disk,
+        one file per page and revision. The least recently used files are removed
+        as soon as the cache grows beyond max_size.
+
+        Args:
+            directory (str): directory the cached pages are stored in
+            max_size (int, optional): maximum size of all cached pages in bytes. Defaults to 10 MiB.
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _prefix(self, key):
+        """ Returns the file name prefix shared by all revisions of key """
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def _path(self, key, version):
+        """ Returns the path of the file holding the given revision of key """
+        return os.path.join(self.directory, f"{self._prefix(key)}-{version}.txt")
+
+    def get(self, key, version):
+        """
+        Returns the cached source of a page revision.
+
+        Args:
+            key (str): key of the page, e.g. wiki url and page name
+            version: revision of the page as reported by the wiki
+
+        Returns:
+            str: the cached page source or None if the revision isn't cached
+        """
+        path = self._path(key, version)
+        try:
+            with open(path, "r", encoding="utf-8") as fh:
+                content = fh.read()
+            # mark as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return content
+
+    def put(self, key, version, content):
+        """
+        Stores a page revision and removes older revisions of the same page.
+
+        Args:
+            key (str): key of the page, e.g. wiki url and page name
+            version: revision of the page as reported by the wiki
+            content (str): source of the page
+        """
+        path = self._path(key, version)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            fh.write(content)
+        os.replace(tmp, path)
+        with self._lock:
+            self._remove(self._prefix(key), keep=os.path.basename(path))
+            self._evict()
+
+    def invalidate(self, key=None):
+        """
+        Removes all revisions of the given page or, without key, the whole cache.
+
+        Args:
+            key (str, optional): key of the page to remove. Defaults to None.
+        """
+        with self._lock:
+            self._remove(self._prefix(key) if key is not None else "")
+
+    def _entries(self):
+        """ Returns the DirEntry of every cached page """
+        return [e for e in os.scandir(self.directory) if e.name.endswith(".txt")]
+
+    def _remove(self, prefix, keep=None):
+        """ Removes the cached files starting with prefix, except keep """
+        for entry in self._entries():
+            if entry.name.startswith(prefix) and entry.name != keep:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def _evict(self):
+        """ Removes the least recently used files until the cache fits into max_size """
+        entries = []
+        for entry in self._entries():
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
@@ -5,23 +5,72 @@ import re
 import sys
 import json
 import datetime
-from jinja2 import Template
-import dokuwiki
-import collections
+import functools
+import contextlib
+import atexit
 import argparse
-from email.mime.text import MIMEText
-import email.utils
-import email.charset
-import smtplib
-from utils import join_url
+import signal
+import time
+import random
+import threading
+from utils import join_url, LazyModule
+from protocol import Event, Section, Protocol, merge_sections
+from recurrence import Recurrence, WEEKDAYS, parse_date
+from indexpage import IndexPage
+from settings import load_config, ConfigError
+import metrics
+from metrics import timed, result_size, argument_size
 
+# imported on first use, see LazyModule
+dokuwiki = LazyModule("dokuwiki")
+jinja2 = LazyModule("jinja2")
+smtplib = LazyModule("smtplib")
+xmlrpc_client = LazyModule("xmlrpc.client")
+concurrent_futures = LazyModule("concurrent.futures")
+email_message = LazyModule("email.message")
+email_policy = LazyModule("email.policy")
+email_utils = LazyModule("email.utils")
+difflib = LazyModule("difflib")
+http_client = LazyModule("http.client")
+pagecache = LazyModule("pagecache")
+eventstore = LazyModule("eventstore")
+searchindex = LazyModule("searchindex")
+attendance = LazyModule("attendance")
+digest = LazyModule("digest")
 
-Event = collections.namedtuple("Event", "date, description")
-Section = collections.namedtuple("Section", "topic, contents")
+# placeholder if no upcoming events are known
+EMPTY_EVENT = ("yyyy-mm-dd", " Hier könnte dein Termin stehen.")
+
+# serializes the updates of the file with the mailed protocol revisions
+MAILED_LOCK = threading.Lock()
+
+# XML-RPC methods that only read and can be retried safely
+READ_METHODS = {
+    "dokuwiki.getPagelist",
+    "dokuwiki.getVersion",
+    "wiki.getPage",
+    "wiki.getPageInfo",
+    "wiki.getPageVersion",
+    "wiki.getPageVersions",
+}
+# seconds before the first retry, doubled for every further retry
+RETRY_BACKOFF = 0.5
+RETRY_BACKOFF_MAX = 8
 
 
 class Wiki:
-    def __init__(self, url, wikiuser, wikipass, nice_url="none"):
+    @timed("wiki.login")
+    def __init__(
+        self,
+        url,
+        wikiuser,
+        wikipass,
+        nice_url="none",
+        cache=None,
+        timeout=30,
+        retries=2,
+        hedge_after=None,
+    ):
         """
         Constructor method for class Wiki
         
@@ -30,12 +79,24 @@ class Wiki:
             wikiuser (str): Login username
             wikipass (str): Login password
             nice_url (str): dokuwiki nice url setting. Valid values: "none", "internal", "htaccess"
+            cache (PageCache, optional): cache for page sources, validated by the page revision. Defaults to None.
+            timeout (float, optional): seconds to wait for a response. Defaults to 30.
+            retries (int, optional): how often a failed request is repeated, see _call(). Defaults to 2.
+            hedge_after (float, optional): seconds after which a slow read is sent a
+                second time over another connection, the first answer wins. Defaults to None (never).
         
         Raises:
             err: exceptions that occurred while accessing the wiki
         """
+        self.timeout = timeout
+        self.retries = retries
+        self.hedge_after = hedge_after
+        self._credentials = (url, wikiuser, wikipass)
+        # logged in clients for hedged requests and the executor running them
+        self._spares = []
+        self._executor = None
         try:
-            self.wiki = dokuwiki.DokuWiki(url, wikiuser, wikipass)
+            self.wiki = self._retrying(self._connect, True)
         except dokuwiki.DokuWikiError as err:
             raise err
         if nice_url == "none":
@@ -46,7 +107,12 @@ class Wiki:
             self.baseurl = join_url([url], trailing_slash=True)
         else:
             self.baseurl = join_url([url, "doku.php?id="])
+        self.url = url
+        self.cache = cache
+        self.multicall_supported = True
+        self.skipped_writes = 0
 
+    @timed("wiki.get_page", result_size)
     def get_page(self, page):
         """
         Returns the plaintext source of a given page.
@@ -60,11 +126,14 @@ class Wiki:
         Returns:
             str: the plaint text source of the given page
         """
+        if self.cache is not None:
+            return self.get_pages([page])[0]
         try:
-            return self.wiki.pages.get(page)
+            return self._call([("wiki.getPage", page)])[0]
         except dokuwiki.DokuWikiError as err:
             raise err
 
+    @timed("wiki.get_page_versions")
     def get_page_versions(self, page):
         """
         Returns a list of the last versions of a given page
@@ -79,10 +148,31 @@ class Wiki:
             list: a list containing information about all versions of a page
         """
         try:
-            return self.wiki.pages.versions(page)
+            return self._call([("wiki.getPageVersions", page, 0)])[0]
         except dokuwiki.DokuWikiError as err:
             raise err
 
+    @timed("wiki.get_page_version", result_size)
+    def get_page_version(self, page, version):
+        """
+        Returns the plaintext source of an older revision of a given page.
+
+        Args:
+            page (str): DokuWiki page name
+            version (int): revision of the page, as returned by get_page_versions()
+
+        Raises:
+            err: exceptions that occurred while accessing the wiki
+
+        Returns:
+            str: the plain text source of the given revision
+        """
+        try:
+            return self._call([("wiki.getPageVersion", page, version)])[0]
+        except dokuwiki.DokuWikiError as err:
+            raise err
+
+    @timed("wiki.get_page_info")
     def get_page_info(self, page):
         """
         Returns meta information about a given page
@@ -97,7 +187,7 @@ class Wiki:
             dict: metainformation about the page (e.g, name, lastModified, author, version)
         """
         try:
-            return self.wiki.pages.info(page)
+            return self._call([("wiki.getPageInfo", page)])[0]
         except dokuwiki.DokuWikiError as err:
             raise err
 
@@ -117,6 +207,7 @@ class Wiki:
 
         return False
 
+    @timed("wiki.set_page", argument_size(2, "content"))
     def set_page(self, page, content, summary="modified by plenumsbot"):
         """
         Write given context to a given page.
@@ -133,11 +224,426 @@ class Wiki:
             bool: True if the page was written successfully
         """
         try:
-            self.wiki.pages.set(page, content, sum=summary)
+            self._call([("wiki.putPage", page, content, {"sum": summary})])
         except dokuwiki.DokuWikiError as err:
             raise err
         return True
 
+    @staticmethod
+    def unchanged(current, content):
+        """
+        Returns True if writing content wouldn't change a page with the source current.
+        DokuWiki drops carriage returns and trailing whitespace when saving a page.
+
+        Args:
+            current (str): current plaintext source of the page
+            content (str): plaintext source to be written
+
+        Returns:
+            bool: True if both sources are equal after normalization
+        """
+        return current.replace("\r", "").rstrip() == content.replace("\r", "").rstrip()
+
+    @timed("wiki.multicall", result_size)
+    def multicall(self, calls, safe_to_retry=None):
+        """
+        Executes several XML-RPC calls in a single request using system.multicall.
+        If the wiki doesn't support system.multicall, the calls are sent one by one.
+
+        Args:
+            calls (list of tuple): calls to execute, each one a tuple of the method name and its arguments
+            safe_to_retry (bool, optional): the calls may be repeated after an error.
+                Defaults to None (only if all calls just read).
+
+        Raises:
+            err: exceptions that occurred while accessing the wiki
+
+        Returns:
+            list: the results of the calls in the same order as calls
+        """
+        return self._call(calls, safe_to_retry)
+
+    def _connect(self):
+        """ Returns a new logged in dokuwiki.DokuWiki client using self.timeout """
+        url, wikiuser, wikipass = self._credentials
+        return dokuwiki.DokuWiki(
+            url, wikiuser, wikipass, transport=timeout_transport(url, self.timeout)
+        )
+
+    def _call(self, calls, safe_to_retry=None):
+        """
+        Sends calls to the wiki in one request. Requests failing with a network
+        error, a timeout or a server error are repeated up to self.retries times
+        after a jittered exponential backoff, if they are safe to repeat: reads
+        always, writes only if the request didn't reach the wiki. Errors reported
+        by DokuWiki itself are never retried. Reads taking longer than
+        self.hedge_after are sent a second time, see _hedged().
+
+        Args:
+            calls (list of tuple): calls to execute, each one a tuple of the method name and its arguments
+            safe_to_retry (bool, optional): the calls may be repeated after an error.
+                Defaults to None (only if all calls just read).
+
+        Raises:
+            err: exceptions that occurred while accessing the wiki
+
+        Returns:
+            list: the results of the calls in the same order as calls
+        """
+        reads = all(method in READ_METHODS for method, *_ in calls)
+        if safe_to_retry is None:
+            safe_to_retry = reads
+        if reads and self.hedge_after is not None:
+            return self._retrying(lambda: self._hedged(calls), safe_to_retry)
+        return self._retrying(lambda: self._execute(self.wiki, calls), safe_to_retry)
+
+    def _retrying(self, function, safe_to_retry):
+        """
+        Calls function, repeating it after transient errors, see _call().
+
+        Args:
+            function (callable): sends a request to the wiki
+            safe_to_retry (bool): the request may be repeated even if it reached the wiki
+
+        Returns:
+            the result of function
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                return function()
+            except Exception as err:
+                if attempt == self.retries or not self._transient(err, safe_to_retry):
+                    raise
+            metrics.registry.count("retries")
+            backoff = min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * 2 ** attempt)
+            time.sleep(random.uniform(0, backoff))
+
+    @staticmethod
+    def _transient(err, safe_to_retry):
+        """
+        Returns True if a request failing with err may succeed when repeated.
+
+        Args:
+            err (Exception): error raised by the request
+            safe_to_retry (bool): the request may be repeated even if it reached the wiki
+
+        Returns:
+            bool: True if the request should be repeated
+        """
+        if isinstance(err, ConnectionRefusedError):
+            # nothing was sent, so even writes can be repeated
+            return True
+        if not safe_to_retry:
+            return False
+        if isinstance(err, xmlrpc_client.ProtocolError):
+            return err.errcode >= 500 or err.errcode == 429
+        return isinstance(err, (OSError, http_client.HTTPException))
+
+    def _execute(self, client, calls):
+        """
+        Sends calls with the given dokuwiki.DokuWiki client, in one request if
+        system.multicall is available.
+
+        Args:
+            client (dokuwiki.DokuWiki): client sending the request
+            calls (list of tuple): calls to execute, each one a tuple of the method name and its arguments
+
+        Returns:
+            list: the results of the calls in the same order as calls
+        """
+        if self.multicall_supported and len(calls) > 1:
+            multicall = xmlrpc_client.MultiCall(client.proxy)
+            for method, *args in calls:
+                getattr(multicall, method)(*args)
+            try:
+                results = multicall().results
+            except xmlrpc_client.Fault:
+                # errors of single calls are part of the results, so a fault
+                # here means that system.multicall itself is not available
+                self.multicall_supported = False
+                metrics.registry.count("retries")
+            else:
+                return [self._multicall_result(result) for result in results]
+        return [client.send(method, *args) for method, *args in calls]
+
+    def _hedged(self, calls):
+        """
+        Sends read calls and, if there is no answer after self.hedge_after
+        seconds, sends them again with a second client. The first successful
+        answer is returned. If the second client wins, it becomes the main client
+        and the first one is reused for later hedged requests once it's done.
+
+        Args:
+            calls (list of tuple): read calls to execute
+
+        Returns:
+            list: the results of the calls in the same order as calls
+        """
+        if self._executor is None:
+            # losing requests keep running until they time out
+            self._executor = concurrent_futures.ThreadPoolExecutor(max_workers=8)
+        primary_client = self.wiki
+        primary = self._executor.submit(self._execute, primary_client, calls)
+        try:
+            return primary.result(timeout=self.hedge_after)
+        except concurrent_futures.TimeoutError:
+            pass
+        spare = self._spares.pop() if self._spares else self._connect()
+        metrics.registry.count("hedged_reads")
+        hedge = self._executor.submit(self._execute, spare, calls)
+        for winner in concurrent_futures.as_completed([primary, hedge]):
+            if winner.exception() is None:
+                break
+        if winner is hedge:
+            self.wiki, loser, loser_client = spare, primary, primary_client
+        else:
+            loser, loser_client = hedge, spare
+        loser.add_done_callback(lambda _: self._spares.append(loser_client))
+        return winner.result()
+
+    @staticmethod
+    def _multicall_result(result):
+        """
+        Unpacks a single result of system.multicall, like dokuwiki.DokuWiki.send
+        does for single calls.
+
+        Args:
+            result (list or dict): one entry of the multicall response
+
+        Raises:
+            dokuwiki.DokuWikiError: the call returned an error
+
+        Returns:
+            the result of the call
+        """
+        if isinstance(result, list):
+            return result[0]
+        if result["faultCode"] == 121:
+            return {}
+        if result["faultCode"] == 321:
+            return []
+        raise dokuwiki.DokuWikiError(
+            xmlrpc_client.Fault(result["faultCode"], result["faultString"])
+        )
+
+    @timed("wiki.get_pages", result_size)
+    def get_pages(self, pages, cached=True):
+        """
+        Returns the plaintext sources of several pages, fetched in one request.
+
+        Args:
+            pages (list of str): DokuWiki page names
+            cached (bool, optional): use the page cache, if any. Defaults to True.
+
+        Raises:
+            err: exceptions that occurred while accessing the wiki
+
+        Returns:
+            list of str: the plain text sources in the same order as pages
+        """
+        if self.cache is None or not cached:
+            return self.multicall([("wiki.getPage", page) for page in pages])
+        return self.get_pages_revisions(pages)[0]
+
+    def get_pages_revisions(self, pages):
+        """
+        Returns the plaintext sources of several pages together with their current
+        revisions. Without cache, sources and revisions are fetched in one request.
+
+        Args:
+            pages (list of str): DokuWiki page names
+
+        Raises:
+            err: exceptions that occurred while accessing the wiki
+
+        Returns:
+            tuple: list of the plain text sources and list of the revisions (None
+            for missing pages), both in the same order as pages
+        """
+        if self.cache is None:
+            results = self.multicall(
+                [("wiki.getPage", page) for page in pages]
+                + [("wiki.getPageInfo", page) for page in pages]
+            )
+            return (
+                results[: len(pages)],
+                [self.revision(info) for info in results[len(pages) :]],
+            )
+        # only pages whose current revision isn't cached are downloaded
+        contents = {}
+        versions = {}
+        revisions = []
+        hits = 0
+        for page, info in zip(pages, self.get_pages_info(pages)):
+            version = self.revision(info)
+            revisions.append(version)
+            if not version:
+                # page doesn't exist
+                contents[page] = ""
+                continue
+            content = self.cache.get(f"{self.url}|{page}", version)
+            if content is None:
+                versions[page] = version
+            else:
+                contents[page] = content
+                hits += 1
+        missing = list(versions)
+        metrics.registry.count("page_cache_hits", hits)
+        metrics.registry.count("page_cache_misses", len(missing))
+        fetched = self.multicall([("wiki.getPage", page) for page in missing])
+        for page, content in zip(missing, fetched):
+            self.cache.put(f"{self.url}|{page}", versions[page], content)
+            contents[page] = content
+        return [contents[page] for page in pages], revisions
+
+    @staticmethod
+    def revision(info):
+        """ Returns the revision from the page info or None if the page doesn't exist """
+        return info.get("version") or getattr(info.get("lastModified"), "value", None)
+
+    @timed("wiki.list_pages")
+    def list_pages(self, namespace):
+        """
+        Returns all pages in the given namespace and its sub namespaces.
+
+        Args:
+            namespace (str): DokuWiki namespace
+
+        Raises:
+            err: exceptions that occurred while accessing the wiki
+
+        Returns:
+            list of dict: information about the pages (e.g. id, rev, mtime, size)
+        """
+        try:
+            return self._call([("dokuwiki.getPagelist", namespace, {})])[0]
+        except dokuwiki.DokuWikiError as err:
+            raise err
+
+    def get_pages_info(self, pages):
+        """
+        Returns meta information about several pages, fetched in one request.
+
+        Args:
+            pages (list of str): DokuWiki page names
+
+        Raises:
+            err: exceptions that occurred while accessing the wiki
+
+        Returns:
+            list of dict: metainformation about the pages in the same order as pages
+        """
+        return self.multicall([("wiki.getPageInfo", page) for page in pages])
+
+    @timed("wiki.update_pages")
+    def update_pages(self, updates, current=None, revisions=None, retries=3):
+        """
+        Read-modify-write cycle for several pages, safe against concurrent writers
+        like an overlapping run. DokuWiki can't write conditionally, so the
+        history of every written page is checked in the same request as the
+        write. If other revisions were saved between the one read and the one
+        written, the write overwrote them and the update is applied again on top
+        of the newest of them.
+
+        Args:
+            updates (list of tuple): page name, function returning the new source
+                for a given source and optionally an edit summary
+            current (dict, optional): already known sources, keyed by page name
+            revisions (dict, optional): revisions of the known sources, keyed by page name.
+                Pages missing in current or revisions are read in one request.
+            retries (int, optional): maximum number of repeated writes. Defaults to 3.
+
+        Raises:
+            dokuwiki.DokuWikiError: pages still changed concurrently after all retries
+            err: errors that occurred while accessing the wiki
+
+        Returns:
+            int: number of pages written
+        """
+        current = dict(current or {})
+        revisions = dict(revisions or {})
+        missing = [
+            page
+            for page, *_ in updates
+            if page not in current or page not in revisions
+        ]
+        if missing:
+            contents, missing_revisions = self.get_pages_revisions(missing)
+            current.update(zip(missing, contents))
+            revisions.update(zip(missing, missing_revisions))
+        # sources the updates are applied to
+        sources = {page: current[page] for page, *_ in updates}
+        pending = updates
+        written = set()
+        for attempt in range(retries + 1):
+            writes = []
+            for page, update, *summary in pending:
+                content = update(sources[page])
+                if self.unchanged(current[page], content):
+                    continue
+                options = {"sum": summary[0] if summary else "modified by plenumsbot"}
+                writes.append((page, content, options))
+            if attempt == 0:
+                self.skipped_writes += len(updates) - len(writes)
+            if not writes:
+                break
+            # repeating the request can't lose changes of others, they show up
+            # in the history and are merged in the next round
+            results = self.multicall(
+                [("wiki.putPage", *write) for write in writes]
+                + [("wiki.getPageInfo", page) for page, *_ in writes]
+                + [("wiki.getPageVersions", page, 0) for page, *_ in writes],
+                safe_to_retry=True,
+            )
+            conflicts = {}
+            for index, (page, content, _) in enumerate(writes):
+                written.add(page)
+                current[page] = content
+                ours = self.revision(results[len(writes) + index])
+                history = results[2 * len(writes) + index]
+                between = [
+                    entry["version"]
+                    for entry in history
+                    if (revisions[page] or 0) < entry["version"] < ours
+                ]
+                revisions[page] = ours
+                if between:
+                    conflicts[page] = max(between)
+            if not conflicts:
+                break
+            metrics.registry.count("write_conflicts", len(conflicts))
+            if attempt == retries:
+                raise dokuwiki.DokuWikiError(
+                    f"{', '.join(conflicts)} changed concurrently, "
+                    f"gave up after {retries} retries"
+                )
+            # apply the updates again to the overwritten revisions
+            pending = [entry for entry in updates if entry[0] in conflicts]
+            sources = dict(
+                zip(
+                    conflicts,
+                    self.multicall(
+                        [
+                            ("wiki.getPageVersion", page, version)
+                            for page, version in conflicts.items()
+                        ]
+                    ),
+                )
+            )
+        return len(written)
+
+    def redirect_content(self, redirect_dest):
+        """
+        Returns the page source of a redirect to redirect_dest
+
+        Args:
+            redirect_dest (str): name of the page to be redirected to
+
+        Returns:
+            str: DokuWiki source of the redirect page
+        """
+        return f"~~GOTO>{redirect_dest}~~"
+
     def set_redirect(self, redirect_src, redirect_dest):
         """
         creates a redirect from redirect_src to redirect_dest
@@ -146,12 +652,89 @@ class Wiki:
             redirect_src (str): name of the page to be redirected from
             redirect_dest (str): name of the page to be redirected to
         """
-        redirect_content = f"~~GOTO>{redirect_dest}~~"
+        redirect_content = self.redirect_content(redirect_dest)
         self.set_page(
             redirect_src, redirect_content, f"redirect target set to {redirect_dest}"
         )
 
 
+class WikiPool:
+    def __init__(self, cache=None):
+        """
+        Constructor method for class WikiPool. The pool keeps logged in Wiki
+        clients per wiki url, so that several plenums hosted in the same wiki
+        share their clients instead of logging in again for every group.
+        A client is only used by one thread at a time.
+
+        Args:
+            cache (PageCache, optional): page cache shared by all clients. Defaults to None.
+        """
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._idle = {}
+
+    def acquire(self, url, wikiuser, wikipass, nice_url="none", **options):
+        """
+        Returns an idle client for the given wiki or creates a new one.
+
+        Args:
+            url (str): Base url of the DokuWiki installation
+            wikiuser (str): Login username
+            wikipass (str): Login password
+            nice_url (str): dokuwiki nice url setting. Valid values: "none", "internal", "htaccess"
+            options: timeout, retries and hedge_after of the client, see Wiki
+
+        Raises:
+            err: exceptions that occurred while accessing the wiki
+
+        Returns:
+            Wiki: a client that must be handed back with release()
+        """
+        key = (url, wikiuser, nice_url, tuple(sorted(options.items())))
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if idle:
+                return idle.pop()
+        wiki = Wiki(url, wikiuser, wikipass, nice_url, self.cache, **options)
+        wiki.pool_key = key
+        return wiki
+
+    def release(self, wiki):
+        """
+        Hands a client back to the pool.
+
+        Args:
+            wiki (Wiki): client returned by acquire()
+        """
+        with self._lock:
+            self._idle.setdefault(wiki.pool_key, []).append(wiki)
+
+    @contextlib.contextmanager
+    def client(self, config):
+        """
+        Context manager providing a client for the wiki of a plenum.
+
+        Args:
+            config (Settings): configuration of the plenum
+
+        Yields:
+            Wiki: a client, handed back to the pool afterwards
+        """
+        wiki = self.acquire(
+            config.wiki_url,
+            config.wiki_user,
+            config.wiki_password,
+            config.wiki_nice_url,
+            timeout=config.wiki_timeout,
+            retries=config.wiki_retries,
+            hedge_after=config.wiki_hedge_after,
+        )
+        try:
+            yield wiki
+        finally:
+            self.release(wiki)
+
+
 class Plenum:
     def __init__(
         self,
@@ -160,33 +743,76 @@ class Plenum:
         tpl_plenum,
         tpl_blank,
         nice_url="none",
-        today=datetime.date.today(),
+        today=None,
+        recurrence=None,
     ):
         """
         Constructor method for class Plenum.
         
         Args:
-            day_of_week (int): Number between 0-6; 0=Monday, 1=Tuesday, ..., 6=Sunday
+            day_of_week (int): Number between 0-6; 0=Monday, 1=Tuesday, ..., 6=Sunday.
+                May be None if recurrence is given, it is then the first weekday of the rule.
             namespace (str): DokuWiki namespace in which the protocol pages are located
             tpl_plenum (str): file containing the protocol jinja2-template
             tpl_blank (str): file containing the topics skeleton used to create a fresh protocol draft
             today (datetime.date, optional): Date the script runs. Change only for debugging / testing purposes. Defaults to datetime.date.today().
+            recurrence (Recurrence, optional): dates the plenum takes place on. Defaults to every week on day_of_week.
         """
+        if today is None:
+            today = datetime.date.today()
+        if recurrence is None:
+            recurrence = Recurrence.weekly(day_of_week, today=today)
+        if day_of_week is None:
+            day_of_week = recurrence.byday[0][1]
         self.day_of_week = day_of_week
+        self.recurrence = recurrence
         self.next_date = self._calc_next_date(today)
         self.last_date = self._calc_last_date(today)
-        self.next_page = ":".join([namespace, self.next_date.strftime("%Y-%m-%d")])
-        self.last_page = ":".join([namespace, self.last_date.strftime("%Y-%m-%d")])
-        try:
-            with open(tpl_plenum, "r") as fh:
-                self.tpl_plenum = fh.read()
-        except (FileNotFoundError, PermissionError) as e:
-            print(f"unable to load plenum template: {e}")
-        try:
-            with open(tpl_blank, "r") as fh:
-                self.tpl_blank = fh.read()
-        except (FileNotFoundError, PermissionError) as e:
-            print(f"unable to load plenum blank topics template: {e}")
+        self.namespace = namespace
+        self.next_page = self.page(self.next_date)
+        self.last_page = self.page(self.last_date)
+        # the templates are loaded on first use
+        self._tpl_plenum_file = tpl_plenum
+        self._tpl_blank_file = tpl_blank
+        self._tpl_plenum = None
+        self._tpl_blank = None
+
+    @property
+    def tpl_plenum(self):
+        """ The compiled protocol template """
+        if self._tpl_plenum is None:
+            try:
+                self._tpl_plenum = template_environment(
+                    os.path.dirname(os.path.abspath(self._tpl_plenum_file))
+                ).get_template(os.path.basename(self._tpl_plenum_file))
+            except (jinja2.TemplateNotFound, PermissionError) as e:
+                print(f"unable to load plenum template: {e}")
+                raise
+        return self._tpl_plenum
+
+    @property
+    def tpl_blank(self):
+        """ The topics skeleton used to create a fresh protocol draft """
+        if self._tpl_blank is None:
+            try:
+                with open(self._tpl_blank_file, "r") as fh:
+                    self._tpl_blank = fh.read()
+            except (FileNotFoundError, PermissionError) as e:
+                print(f"unable to load plenum blank topics template: {e}")
+                raise
+        return self._tpl_blank
+
+    def page(self, date):
+        """
+        Returns the name of the protocol page of the plenum on the given date.
+
+        Args:
+            date (datetime.date): date of the plenum
+
+        Returns:
+            str: DokuWiki page name
+        """
+        return ":".join([self.namespace, date.strftime("%Y-%m-%d")])
 
     def _calc_next_date(self, today):
         """
@@ -198,10 +824,7 @@ class Plenum:
         Returns:
             datetime.date: Next plenums date.
         """
-        delta_days = self.day_of_week - today.weekday()
-        if delta_days <= 0:
-            delta_days += 7
-        return today + datetime.timedelta(delta_days)
+        return self.recurrence.next(today)
 
     def _calc_last_date(self, today):
         """
@@ -213,11 +836,23 @@ class Plenum:
         Returns:
             datetime.date: Date the last plenum took place.
         """
-        # today = datetime.date.today()
-        delta_days = self.day_of_week - today.weekday()
-        if delta_days > 0:
-            delta_days -= 7
-        return today + datetime.timedelta(delta_days)
+        return self.recurrence.last(today)
+
+    @timed("plenum.parse_protocol")
+    def parse_protocol(self, plenum_page):
+        """
+        Parses the given protocol. Already parsed protocols are returned unchanged,
+        so the methods below can be called with either the page source or a Protocol.
+
+        Args:
+            plenum_page (str or Protocol): Plaintext plenum protocol (DokuWiki source)
+
+        Returns:
+            Protocol: the parsed protocol
+        """
+        if isinstance(plenum_page, Protocol):
+            return plenum_page
+        return Protocol.parse(plenum_page)
 
     def last_plenum_took_place(self, plenum_page):
         """
@@ -227,19 +862,12 @@ class Plenum:
         to pass this check. hh and mm have to be replaced by a valid time designation.
                 
         Args:
-            plenum_page (str): Plaintext plenum protocol (DokuWiki source)
+            plenum_page (str or Protocol): Plaintext plenum protocol (DokuWiki source)
         
         Returns:
             bool: true it the plenum took place and false if it didn't take place.
         """
-
-        page_lines = plenum_page.splitlines()
-        match = re.search(
-            r"^Ende:\s*\d{2}:\d{2}\s*Uhr\s*$",
-            "\n".join(page_lines[-2:]),
-            re.MULTILINE | re.IGNORECASE,
-        )
-        return bool(match)
+        return self.parse_protocol(plenum_page).took_place
 
     def upcoming_events(self, plenum_page):
         """
@@ -247,34 +875,19 @@ class Plenum:
         will be in the past, when the next plenum takes place.
         
         Args:
-            plenum_page (str): Plaintext plenum protocol (DokuWiki source)
+            plenum_page (str or Protocol): Plaintext plenum protocol (DokuWiki source)
         
         Returns:
             list of Event: list of Event, containing all events that take place after self.nextdate. 
             A placeholder entry is created if no upcoming event where found.
         """
-        # find section termine
-        plenum_page_list = plenum_page.splitlines()
-        events_heading = re.findall(
-            r"^(\s*={5}\s*Termine\s*={5}\s*)$",
-            plenum_page,
-            re.MULTILINE | re.IGNORECASE,
-        )
+        protocol = self.parse_protocol(plenum_page)
         # return False if heading "Termine" not in page content
-        if not events_heading:
+        if not protocol.has_events:
             return False
-        events_heading = events_heading[0].strip("\n")
-        events_begin = plenum_page_list.index(events_heading) + 1
-        eventlist = []
-        for line in plenum_page_list[events_begin:]:
-            # 1st capture group = date, 2nd = event description
-            event = re.findall(r"^\s{2,4}\*\s(\d{4}-\d{2}-\d{2})(.*)$", line)
-            if event and event[0][0] > self.next_date.strftime("%Y-%m-%d"):
-                event_entry = Event(event[0][0], event[0][1])
-                eventlist.append(event_entry)
-        empty_events_template = ("yyyy-mm-dd", " Hier könnte dein Termin stehen.")
+        eventlist = protocol.events_after(self.next_date)
         if len(eventlist) == 0:
-            eventlist.append(empty_events_template)
+            eventlist.append(EMPTY_EVENT)
         return eventlist
 
     def extract_content(self, plenum_page):
@@ -284,39 +897,55 @@ class Plenum:
         protocol draft, too.
         
         Args:
-            plenum_page (str): Plaintext plenum protocol (DokuWiki source)
+            plenum_page (str or Protocol): Plaintext plenum protocol (DokuWiki source)
         
         Returns:
             list of Section: list of Section, containing all sections, except "Termine", from the
             given protocol page.
         """
-        pagelist = plenum_page.splitlines()
-        section_index = []
-        for i in range(0, len(pagelist)):
-            if re.match(r"^={5}[^=]*={5}$", pagelist[i].strip()):
-                section_index.append(i)
-        section_index.append(len(pagelist) - 1)
-        sections = []
-        for idx in section_index:
-            if section_index.index(idx) != len(section_index) - 1:
-                sections.append((idx, section_index[section_index.index(idx) + 1] - 1))
-        section_list = []
-        for section in sections:
-            headline = pagelist[section[0]].strip("=").strip()
-            content = "\n".join(pagelist[section[0] + 1 : section[1]])
-            section_list.append(Section(headline, content))
-        return section_list
-
-    def generate_page_next_plenum(self, plenum_page):
+        return list(self.parse_protocol(plenum_page).sections)
+
+    @timed("plenum.render", result_size)
+    def generate_page_next_plenum(self, plenum_page, events=None):
         """
         Combines all parts needed to generate the protocol draft for the next plenum.
         
         Args:
-            plenum_page (str): Plaintext plenum protcol (DokuWiki source)
+            plenum_page (str or Protocol): Plaintext plenum protcol (DokuWiki source)
+            events (list of Event, optional): upcoming events, e.g. from an EventStore.
+                Defaults to the events found in plenum_page.
         
         Returns:
             str: DokuWiki formatted plenum protocol draft
         """
+        return self.tpl_plenum.render(**self._page_context(plenum_page, events))
+
+    def stream_page_next_plenum(self, plenum_page, events=None):
+        """
+        Like generate_page_next_plenum(), but yields the draft piece by piece
+        instead of building the whole page in memory.
+
+        Args:
+            plenum_page (str or Protocol): Plaintext plenum protcol (DokuWiki source)
+            events (list of Event, optional): upcoming events. Defaults to the events found in plenum_page.
+
+        Returns:
+            iterator of str: parts of the DokuWiki formatted plenum protocol draft
+        """
+        return self.tpl_plenum.generate(**self._page_context(plenum_page, events))
+
+    def _page_context(self, plenum_page, events=None):
+        """
+        Returns the variables for the protocol template of the next plenum.
+
+        Args:
+            plenum_page (str or Protocol): Plaintext plenum protcol (DokuWiki source)
+            events (list of Event, optional): upcoming events. Defaults to the events found in plenum_page.
+
+        Returns:
+            dict: variables used in the protocol template
+        """
+        plenum_page = self.parse_protocol(plenum_page)
         # checking if last plenum took place
         if self.last_plenum_took_place(plenum_page):
             # last plenum took place
@@ -334,57 +963,54 @@ class Plenum:
                 )
             content = content.strip()
         # processing events
+        if events is None:
+            eventlist = self.upcoming_events(plenum_page)
+        else:
+            eventlist = events or [EMPTY_EVENT]
         events = ""
-        eventlist = self.upcoming_events(plenum_page)
         if eventlist:
             for event in eventlist:
                 events += f"  * {event[0]}{event[1]}\n"
         else:
             eventlist = ""
-        # generate new page from template
-        template = Template(self.tpl_plenum)
-        return template.render(
+        return dict(
             date_plenum=self.next_date, upcoming_events=events, content=content
         )
 
+    def parse_index(self, index_page):
+        """
+        Parses the given index page. Already parsed pages are returned unchanged.
+
+        Args:
+            index_page (str or IndexPage): plaintext of the indexpage (DokuWiki source)
+
+        Returns:
+            IndexPage: the parsed index page
+        """
+        if isinstance(index_page, IndexPage):
+            return index_page
+        return IndexPage(index_page)
+
+    @timed("plenum.update_index", result_size)
     def update_index_page(self, index_page, namespace):
         """
-        Adds the page to the overview page
+        Adds the page to the overview page. A parsed index page is updated in place.
         
         Args:
-            index_page (str): plaintext of the indexpage (DokuWiki source)
+            index_page (str or IndexPage): plaintext of the indexpage (DokuWiki source)
             namespace (str): namespace where the plenums protocols are saved to
         
         Returns:
             str: updated plaintext of the indexpage (DokuWiki source)
         """
-        plenum_list = index_page.splitlines()
-        # check if header with current year is present
-        year_header = f"===== {self.next_date.year} ====="
-        if year_header in plenum_list:
-            insert_index = plenum_list.index(year_header) + 1
-        else:
-            insert_index = None
-        # check is header 'Protokolle' is present
-        protocol_header = "====== Protokolle ======"
-        if "====== Protokolle ======" in plenum_list:
-            protocol_index = plenum_list.index("====== Protokolle ======") + 1
-        else:
-            protocol_index = 0
-        if not insert_index:
-            insert_index = protocol_index + 2
-            plenum_list.insert(protocol_index, f"===== {self.next_date.year} =====")
-        plenum_list.insert(insert_index, f"  * [[{ self.next_page }]]")
-        return "\n".join(plenum_list)
+        index_page = self.parse_index(index_page)
+        index_page.add(self.next_page, self.next_date)
+        return index_page.text()
 
     def plenum_in_list(self, plenum_page):
-        """ Returns True if self.next_page is found in plenum_page.
+        """ Returns True if self.next_page is linked in plenum_page (str or IndexPage).
             Used to prevent double entries in the list of plenums """
-        finding = plenum_page.find(self.next_page)
-        if finding >= 0:
-            return True
-        else:
-            return False
+        return self.next_page in self.parse_index(plenum_page)
 
 
 class Mail:
@@ -392,7 +1018,9 @@ class Mail:
         self, mailserver, username, password, port=587, ssl=False, starttls=True
     ):
         """
-        Constructor method for class Mail.
+        Constructor method for class Mail. The connection to the mailserver is
+        established when the first mail is sent and kept open for further mails
+        until close() is called.
         
         Args:
             mailserver (str): smtp/submission server to user
@@ -402,21 +1030,64 @@ class Mail:
             ssl (bool, optional): Use SSL encryption. Defaults to False.
             starttls (bool, optional): Use STARTTLS encryption. Defaults to True.
         """
-        self.mail = smtplib.SMTP(host=mailserver, port=port)
+        self.mailserver = mailserver
+        self.username = username
+        self.password = password
+        self.port = port
+        self.ssl = ssl
+        self.starttls = starttls
+        self.mail = None
+        self._lock = threading.Lock()
+
+    @timed("mail.connect")
+    def connect(self):
+        """
+        Connects and authenticates to the mailserver, unless already connected.
+
+        Raises:
+            err: exceptions that occurred while connecting to the mailserver
+        """
+        if self.mail is not None:
+            return
+        if self.ssl:
+            mail = smtplib.SMTP_SSL(host=self.mailserver, port=self.port)
+        else:
+            mail = smtplib.SMTP(host=self.mailserver, port=self.port)
+            if self.starttls:
+                mail.starttls()
+        mail.login(self.username, self.password)
+        self.mail = mail
+
+    def close(self):
+        """ Closes the connection to the mailserver, if one is open """
+        with self._lock:
+            if self.mail is None:
+                return
+            try:
+                self.mail.quit()
+            except smtplib.SMTPException:
+                pass
+            self.mail = None
 
-        if starttls:
-            self.mail.starttls()
-        self.mail.login(username, password)
+    def __enter__(self):
+        return self
 
-    def send(self, subject, recipient, sender, text):
+    def __exit__(self, *exc):
+        self.close()
+
+    @timed("mail.send", argument_size(4, "text"))
+    def send(self, subject, recipient, sender, text, html=None):
         """
         Sends an email to the given recipient with given sender, topic and text.
+        With html, the mail is sent as multipart/alternative with both versions.
+        Every part is encoded as UTF-8 with the most compact transfer encoding.
         
         Args:
             subject (str): email subject
-            recipient (str): email recipient
+            recipient (str or list of str): email recipient(s)
             sender (str): name / address of email sender according to RFC 5322
             text (str): Text message of the mail to be sent
+            html (str, optional): HTML version of the message. Defaults to None.
 
         Raises:
             err: exceptions that occurred while sending the mail
@@ -424,37 +1095,871 @@ class Mail:
         Returns:
             bool: True if the mail was sent successfully.
         """
-        message = MIMEText(text, "text")
+        if isinstance(recipient, str):
+            recipient = [recipient]
+        message = email_message.EmailMessage()
         message["From"] = sender
-        message["To"] = recipient
+        message["To"] = ", ".join(recipient)
         message["Subject"] = subject
-        message["Date"] = email.utils.formatdate(localtime=1)
-        message["Message-ID"] = email.utils.make_msgid()
+        message["Date"] = email_utils.formatdate(localtime=1)
+        message["Message-ID"] = email_utils.make_msgid()
+        message.set_content(text, charset="utf-8")
+        if html is not None:
+            message.add_alternative(html, subtype="html", charset="utf-8")
+        # serialized once, with the CRLF line endings sent over SMTP
+        data = message.as_bytes(policy=email_policy.SMTP)
 
-        self.mail.sendmail(message["From"], message["To"], str(message))
-        self.mail.quit()
+        with self._lock:
+            self.connect()
+            try:
+                self.mail.sendmail(sender, recipient, data)
+            except smtplib.SMTPServerDisconnected:
+                # the server closed the idle session, reconnect once
+                metrics.registry.count("retries")
+                self.mail = None
+                self.connect()
+                self.mail.sendmail(sender, recipient, data)
+        return True
 
+    def send_batch(self, messages):
+        """
+        Sends several emails using one session.
 
-def load_config(owndir):
-    """load config from config.(local.)json"""
-    config_file = os.path.join(owndir, "config.json")
-    with open(config_file, "r") as fh:
-        try:
-            config = json.load(fh)
-        except BaseException as e:
-            raise e
+        Args:
+            messages (list of tuple): subject, recipient(s), sender, text and optionally html
+                of every mail, see send()
+
+        Raises:
+            err: exceptions that occurred while sending the mails
+
+        Returns:
+            bool: True if all mails were sent successfully.
+        """
+        for subject, recipient, sender, text, *html in messages:
+            self.send(subject, recipient, sender, text, *html)
+        return True
+
+
+class MailPool:
+    def __init__(self):
+        """
+        Constructor method for class MailPool. The pool shares one Mail session
+        per mailserver and user between all plenums of a run.
+        """
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    def get(self, config):
+        """
+        Returns the session for the mail settings in config. "mail_tls" enables
+        encryption, "mail_starttls" selects STARTTLS instead of implicit TLS.
+
+        Args:
+            config (Settings): configuration of a plenum
+
+        Returns:
+            Mail: the shared session
+        """
+        port = config.mail_port
+        tls = config.mail_tls
+        starttls = config.mail_starttls
+        key = (config.mail_server, port, config.mail_user)
+        with self._lock:
+            if key not in self._sessions:
+                self._sessions[key] = Mail(
+                    config.mail_server,
+                    config.mail_user,
+                    config.mail_password,
+                    port,
+                    tls and not starttls,
+                    tls and starttls,
+                )
+            return self._sessions[key]
+
+    def close(self):
+        """ Closes all sessions """
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions = {}
+        for mail in sessions:
+            mail.close()
+
+
+@functools.lru_cache(maxsize=None)
+def _timeout_transport_class(secure):
+    """ Returns an XML-RPC transport class applying a timeout to its connections """
+    base = xmlrpc_client.SafeTransport if secure else xmlrpc_client.Transport
+
+    class TimeoutTransport(base):
+        def __init__(self, timeout):
+            super().__init__()
+            self.timeout = timeout
+
+        def make_connection(self, host):
+            connection = super().make_connection(host)
+            connection.timeout = self.timeout
+            if connection.sock is not None:
+                connection.sock.settimeout(self.timeout)
+            return connection
+
+    return TimeoutTransport
+
+
+def timeout_transport(url, timeout):
+    """
+    Returns an XML-RPC transport for url, whose requests fail after timeout seconds.
+
+    Args:
+        url (str): url of the XML-RPC server
+        timeout (float): seconds to wait for the server, None to wait forever
+
+    Returns:
+        xmlrpc.client.Transport: the transport
+    """
+    return _timeout_transport_class(url.startswith("https:"))(timeout)
+
+
+@functools.lru_cache(maxsize=None)
+def template_environment(template_dir):
+    """
+    Returns the jinja2 environment for the templates in template_dir. The
+    environment is created once per directory, so every template is compiled
+    only once per process. The compiled templates are also kept in jinja2's
+    bytecode cache to speed up the next run.
+
+    Args:
+        template_dir (str): directory containing the templates
+
+    Returns:
+        jinja2.Environment: environment loading the templates from template_dir
+    """
+    return jinja2.Environment(
+        loader=jinja2.FileSystemLoader(template_dir),
+        bytecode_cache=jinja2.FileSystemBytecodeCache(),
+        # only the HTML mail templates are escaped
+        autoescape=jinja2.select_autoescape(["html.j2"], default_for_string=False),
+        trim_blocks=True,
+        lstrip_blocks=True,
+    )
+
+
+@timed("job.draft")
+def draft_next_plenum(plenum, wiki, config):
+    """
+    Creates the protocol draft for the next plenum, adds it to the index page
+    and points the redirect to it.
+
+    Args:
+        plenum (Plenum): the plenum to create the draft for
+        wiki (Wiki): wiki the protocols are stored in
+        config (Settings): configuration of the plenum
+
+    Returns:
+        int: number of writes skipped because the page already had the new content
+    """
+    pages = [
+        plenum.last_page,
+        config.indexpage,
+        plenum.next_page,
+        config.redirectpage,
+    ]
+    contents, revisions = wiki.get_pages_revisions(pages)
+    current = dict(zip(pages, contents))
+    last_page_content = current[plenum.last_page]
+    events = None
+    if config.events_db:
+        events = sync_events(wiki, config, plenum.next_date)
+    new_page_content = plenum.generate_page_next_plenum(last_page_content, events)
+    redirect = wiki.redirect_content(plenum.next_page)
+    # the index page is changed by other runs too, so it's updated based on the
+    # source actually written over
+    updates = [
+        (plenum.next_page, lambda _: new_page_content),
+        (
+            config.indexpage,
+            lambda source: plenum.update_index_page(source, config.namespace),
+        ),
+        (
+            config.redirectpage,
+            lambda _: redirect,
+            f"redirect target set to {plenum.next_page}",
+        ),
+    ]
+    written = wiki.update_pages(
+        updates, current, dict(zip(pages, revisions)), config.write_retries
+    )
+    return len(updates) - written
+
+
+@timed("job.catch_up")
+def catch_up(plenum, wiki, config, owndir, since):
+    """
+    Creates the protocol drafts of all plenums from since up to the next plenum,
+    that are missing in the wiki, e.g. after an outage. Topics of consecutive
+    skipped plenums are merged and carried over from draft to draft. All pages
+    are read in one request and written in one request, see Wiki.update_pages().
+
+    Args:
+        plenum (Plenum): the plenum to create the drafts for
+        wiki (Wiki): wiki the protocols are stored in
+        config (Settings): configuration of the plenum
+        owndir (str): directory containing the templates
+        since (datetime.date): first plenum date to check
+
+    Returns:
+        int: number of writes skipped because the page already had the new content
+    """
+    recurrence = plenum.recurrence
+    dates = recurrence.between(min(since, plenum.next_date), plenum.next_date)
+    try:
+        previous = [recurrence.last(dates[0] - datetime.timedelta(1))]
+    except ValueError:
+        previous = []
+    pages = [plenum.page(date) for date in previous + dates]
+    pages += [config.indexpage, config.redirectpage]
+    contents, revisions = wiki.get_pages_revisions(pages)
+    current = dict(zip(pages, contents))
+    revisions = dict(zip(pages, revisions))
+    events = None
+    if config.events_db:
+        events = sync_events(wiki, config, dates[0])
+
+    contents = dict(current)
+    source = Protocol.parse(contents[plenum.page(previous[0])] if previous else "")
+    carried = []
+    writes = []
+    created = []
+    for date in dates:
+        # a plenum that took place ends the carry over
+        carried = [] if source.took_place else merge_sections(carried, source.sections)
+        page = plenum.page(date)
+        if date == plenum.next_date or not contents[page].strip():
+            draft = create_plenum(config, owndir, date - datetime.timedelta(1), recurrence)
+            last = Protocol(
+                carried, source.events, {}, source.took_place, source.has_events
+            )
+            upcoming = None
+            if events is not None:
+                upcoming = [e for e in events if e.date > date.strftime("%Y-%m-%d")]
+            contents[page] = draft.generate_page_next_plenum(last, upcoming)
+            writes.append((page, contents[page]))
+            created.append((page, date))
+        source = Protocol.parse(contents[page])
+
+    def add_created(source):
+        index_page = plenum.parse_index(source)
+        index_page.add_many(created)
+        return index_page.text()
+
+    redirect = wiki.redirect_content(plenum.next_page)
+    updates = [(page, lambda _, content=content: content) for page, content in writes]
+    updates += [
+        (config.indexpage, add_created),
+        (
+            config.redirectpage,
+            lambda _: redirect,
+            f"redirect target set to {plenum.next_page}",
+        ),
+    ]
+    written = wiki.update_pages(updates, current, revisions, config.write_retries)
+    return len(updates) - written
+
+
+def sync_events(wiki, config, date):
+    """
+    Updates the event store of a plenum from the wiki and returns the events
+    after date. Also writes the iCalendar feed, if "events_ics" is configured.
+
+    Args:
+        wiki (Wiki): wiki the protocols are stored in
+        config (Settings): configuration of the plenum
+        date (datetime.date): events on or before this date are dropped
+
+    Returns:
+        list of Event: the upcoming events
+    """
+    with eventstore.EventStore(config.events_db) as store:
+        store.sync(wiki, config.namespace)
+        if config.events_ics:
+            feed = store.export_ics(config.namespace, name=config.name)
+            with open(config.events_ics, "w", newline="") as fh:
+                fh.write(feed)
+        return store.upcoming(config.namespace, date)
+
+
+@timed("job.announcement")
+def announce_next_plenum(plenum, wiki, mail, config, owndir):
+    """
+    Sends the announcement of the next plenum with a digest of the collected
+    topics, as plain text and HTML.
+
+    Args:
+        plenum (Plenum): the plenum to announce
+        wiki (Wiki): wiki the protocols are stored in
+        mail (Mail): session used to send the announcement
+        config (Settings): configuration of the plenum
+        owndir (str): directory containing the templates
+    """
+    protocol = Protocol.parse(wiki.get_page(plenum.next_page))
+    plenum_date = plenum.next_date.strftime("%Y-%m-%d")
+    environment = template_environment(owndir)
+    templates = [
+        environment.get_template("template_mail_announcement.j2"),
+        environment.get_template("template_mail_announcement.html.j2"),
+    ]
+
+    def render(topics):
+        context = dict(
+            digest=topics,
+            events=protocol.events,
+            plenum_date=plenum_date,
+            collection_link=f"{wiki.baseurl}{plenum.next_page}",
+        )
+        return ["".join(template.generate(context)) for template in templates]
+
+    # the limit applies to the text and HTML part together
+    _, (text, html) = digest.fit_digest(
+        protocol.sections, render, config.announcement_max_size
+    )
+    mail.send(
+        f"Plenumsankündigung {plenum_date}",
+        config.mail_recipient,
+        config.mail_from,
+        text,
+        html,
+    )
+
+
+def mailed_revisions(path):
+    """
+    Returns the revisions of the protocols already sent by mail.
+
+    Args:
+        path (str): JSON file the revisions are stored in
+
+    Returns:
+        dict: last mailed revision, keyed by page name
+    """
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return {}
+
+
+def set_mailed_revision(path, page, version):
+    """
+    Remembers the revision of a protocol that was sent by mail.
+
+    Args:
+        path (str): JSON file the revisions are stored in
+        page (str): DokuWiki page name of the protocol
+        version (int): revision of the page that was sent
+    """
+    with MAILED_LOCK:
+        revisions = mailed_revisions(path)
+        revisions[page] = version
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as fh:
+            json.dump(revisions, fh, indent=4, sort_keys=True)
+        os.replace(tmp, path)
+
+
+def protocol_diff(page, old, new, old_version, new_version):
+    """
+    Returns the changes between two revisions of a protocol as unified diff.
+
+    Args:
+        page (str): DokuWiki page name of the protocol
+        old (str): plaintext of the old revision
+        new (str): plaintext of the new revision
+        old_version (int): old revision
+        new_version (int): new revision
+
+    Returns:
+        str: the changed lines with one line of context
+    """
+    return "\n".join(
+        difflib.unified_diff(
+            old.splitlines(),
+            new.splitlines(),
+            f"{page} ({old_version})",
+            f"{page} ({new_version})",
+            n=1,
+            lineterm="",
+        )
+    )
+
+
+@timed("job.protocol")
+def mail_protocol(plenum, wiki, mail, config, owndir):
+    """
+    Sends the protocol of the last plenum once its end time is filled in.
+    The revision sent is remembered, later corrections are sent as diff against
+    it. Unless the page changed, only its page info is requested.
+
+    Args:
+        plenum (Plenum): the plenum whose last protocol is sent
+        wiki (Wiki): wiki the protocols are stored in
+        mail (Mail): session used to send the protocol
+        config (Settings): configuration of the plenum
+        owndir (str): directory containing the templates
+
+    Returns:
+        bool: True if a mail was sent
+    """
+    state = config.protocol_state
+    page = plenum.last_page
+    version = wiki.get_page_info(page).get("version")
+    mailed = mailed_revisions(state).get(page)
+    if not version or version == mailed:
+        return False
+    content = wiki.get_page(page)
+    if not Protocol.parse(content).took_place:
+        return False
+    plenum_date = plenum.last_date.strftime("%Y-%m-%d")
+    correction = False
+    protocol = content
+    if mailed is not None:
+        versions = {entry.get("version") for entry in wiki.get_page_versions(page)}
+        # without the mailed revision in the history the whole protocol is sent again
+        if mailed in versions:
+            old = wiki.get_page_version(page, mailed)
+            protocol = protocol_diff(page, old, content, mailed, version)
+            correction = True
+            if not protocol:
+                set_mailed_revision(state, page, version)
+                return False
+    tpl = template_environment(owndir).get_template("template_mail_protocol.j2")
+    message = str(
+        tpl.render(
+            plenum_date=plenum_date,
+            protocol=protocol,
+            protocol_link=f"{wiki.baseurl}{page}",
+            next_plenum_date=plenum.next_date.strftime("%Y-%m-%d"),
+            next_plenum_link=f"{wiki.baseurl}{plenum.next_page}",
+            correction=correction,
+        )
+    )
+    subject = f"Protokoll {plenum_date}"
+    mail.send(
+        f"Korrektur: {subject}" if correction else subject,
+        config.mail_recipient,
+        config.mail_from,
+        message,
+    )
+    set_mailed_revision(state, page, version)
+    return True
 
-    local_config_file = os.path.join(owndir, "config.local.json")
-    if os.path.isfile(local_config_file):
-        with open(local_config_file, "r") as fh:
+
+def create_plenum(config, owndir, today=None, recurrence=None):
+    """
+    Returns the Plenum described by config.
+
+    Args:
+        config (Settings): configuration of the plenum
+        owndir (str): directory containing the templates
+        today (datetime.date, optional): Defaults to datetime.date.today().
+        recurrence (Recurrence, optional): Defaults to the recurrence described by config.
+
+    Returns:
+        Plenum: the plenum
+    """
+    return Plenum(
+        config.plenum_day_of_week,
+        config.namespace,
+        os.path.join(owndir, "template_plenum.j2"),
+        os.path.join(owndir, "template_blank_topics.j2"),
+        today=today,
+        recurrence=recurrence or create_recurrence(config),
+    )
+
+
+def create_recurrence(config):
+    """
+    Returns the Recurrence described by config. Without "recurrence", the plenum
+    takes place every week on "plenum_day_of_week".
+
+    Args:
+        config (Settings): configuration of the plenum
+
+    Returns:
+        Recurrence: dates the plenum takes place on
+    """
+    rule = config.recurrence
+    if rule is None:
+        rule = f"FREQ=WEEKLY;BYDAY={WEEKDAYS[config.plenum_day_of_week]}"
+    start = config.recurrence_start
+    return Recurrence(
+        rule,
+        start=parse_date(start) if start else None,
+        exclude=config.recurrence_exclude,
+        horizon=config.recurrence_horizon,
+    )
+
+
+def print_dates(configs, owndir):
+    """
+    Prints the dates and page names of the last and next plenum of every plenum.
+
+    Args:
+        configs (list of Settings): one configuration per plenum, see Config.plenums
+        owndir (str): directory containing the templates
+    """
+    for config in configs:
+        plenum = create_plenum(config, owndir)
+        print(
+            f"{config.name}: "
+            f"last {plenum.last_date} ({plenum.last_page}), "
+            f"next {plenum.next_date} ({plenum.next_page})"
+        )
+
+
+def run_plenum(
+    config, owndir, wikis, mails, announcement=False, since=None, protocol=False
+):
+    """
+    Runs the draft, announcement or protocol job for a single plenum.
+
+    Args:
+        config (Settings): configuration of the plenum
+        owndir (str): directory containing the templates
+        wikis (WikiPool): pool providing the wiki clients
+        mails (MailPool): pool providing the mail sessions
+        announcement (bool, optional): send the announcement instead of creating the draft. Defaults to False.
+        since (datetime.date, optional): also create the missing drafts since this date. Defaults to None.
+        protocol (bool, optional): send the protocol of the last plenum instead of creating the draft.
+            Defaults to False.
+
+    Returns:
+        int: number of skipped wiki writes, or number of mails sent by the protocol job
+    """
+    plenum = create_plenum(config, owndir)
+    name = config.name
+    with metrics.registry.labels(plenum=name), wikis.client(config) as wiki:
+        if announcement:
+            announce_next_plenum(plenum, wiki, mails.get(config), config, owndir)
+            return 0
+        if protocol:
+            return int(mail_protocol(plenum, wiki, mails.get(config), config, owndir))
+        if since is not None:
+            return catch_up(plenum, wiki, config, owndir, since)
+        return draft_next_plenum(plenum, wiki, config)
+
+
+def run_batch(
+    configs,
+    owndir,
+    announcement=False,
+    workers=4,
+    wikis=None,
+    mails=None,
+    since=None,
+    protocol=False,
+):
+    """
+    Runs the jobs of several plenums concurrently. A failing plenum doesn't
+    affect the others, its error is returned instead of its result.
+
+    Args:
+        configs (list of Settings): one configuration per plenum, see Config.plenums
+        owndir (str): directory containing the templates
+        announcement (bool, optional): send the announcements instead of creating the drafts. Defaults to False.
+        workers (int, optional): maximum number of plenums processed at the same time,
+            with 1 they run one after another in the calling thread. Defaults to 4.
+        wikis (WikiPool, optional): pool providing the wiki clients. Defaults to a new pool.
+        mails (MailPool, optional): pool providing the mail sessions. Defaults to a new pool,
+            which is closed after the run.
+        since (datetime.date, optional): also create the missing drafts since this date. Defaults to None.
+        protocol (bool, optional): send the protocols instead of creating the drafts. Defaults to False.
+
+    Returns:
+        tuple: dict of the results of run_plenum() and dict of the exceptions
+        of the failed plenums, both keyed by plenum name
+    """
+    if wikis is None:
+        wikis = WikiPool()
+    own_mails = mails is None
+    if own_mails:
+        mails = MailPool()
+    results = {}
+    errors = {}
+    run = functools.partial(
+        run_plenum,
+        owndir=owndir,
+        wikis=wikis,
+        mails=mails,
+        announcement=announcement,
+        since=since,
+        protocol=protocol,
+    )
+    if workers == 1:
+        # run in the calling thread, e.g. to be seen by the profiler
+        for config in configs:
             try:
-                local_config = json.load(fh)
-            except BaseException as e:
-                raise e
-    if local_config:
-        return local_config
+                results[config.name] = run(config)
+            except Exception as err:
+                errors[config.name] = err
     else:
-        return config
+        with concurrent_futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(run, config): config.name for config in configs}
+            for future in concurrent_futures.as_completed(futures):
+                try:
+                    results[futures[future]] = future.result()
+                except Exception as err:
+                    errors[futures[future]] = err
+    if own_mails:
+        mails.close()
+    return results, errors
+
+
+def search(configs, index_file, wikis, query, plenum=None, limit=20, offline=False):
+    """
+    Updates the full-text index from the wiki and searches it.
+
+    Args:
+        configs (list of Settings): one configuration per plenum, see Config.plenums
+        index_file (str): file name of the search index
+        wikis (WikiPool): pool providing the wiki clients
+        query (str): words to search for
+        plenum (str, optional): only search the protocols of this plenum. Defaults to None (all).
+        limit (int, optional): maximum number of hits. Defaults to 20.
+        offline (bool, optional): search without updating the index first. Defaults to False.
+
+    Returns:
+        list of Hit: the best matching sections first
+    """
+    with searchindex.SearchIndex(index_file) as index:
+        if not offline:
+            for config in configs:
+                name = config.name
+                if plenum is None or name == plenum:
+                    index.sync(
+                        functools.partial(wikis.client, config),
+                        config.namespace,
+                        name,
+                        config.search_workers,
+                    )
+        return index.search(query, plenum, limit)
+
+
+def meeting_stats(configs, stats_dir, wikis, plenum=None, offline=False):
+    """
+    Updates the meeting statistics of every plenum from the wiki and aggregates them.
+
+    Args:
+        configs (list of Settings): one configuration per plenum, see Config.plenums
+        stats_dir (str): directory the statistics are stored in, one file per plenum
+        wikis (WikiPool): pool providing the wiki clients
+        plenum (str, optional): only the statistics of this plenum. Defaults to None (all).
+        offline (bool, optional): don't update the statistics first. Defaults to False.
+
+    Returns:
+        dict: list of YearStats per plenum name
+    """
+    stats = {}
+    for config in configs:
+        name = config.name
+        if plenum is not None and name != plenum:
+            continue
+        safe_name = re.sub(r"[^\w.-]", "_", name)
+        plenum_stats = attendance.MeetingStats(
+            os.path.join(stats_dir, f"{safe_name}.bin")
+        )
+        if not offline:
+            with wikis.client(config) as wiki:
+                plenum_stats.sync(wiki, config.namespace)
+        stats[name] = plenum_stats.by_year()
+    return stats
+
+
+def report(results, errors, job="draft"):
+    """
+    Prints the outcome of run_batch().
+
+    Args:
+        results (dict): results of the successful plenums, keyed by plenum name
+        errors (dict): exceptions of the failed plenums, keyed by plenum name
+        job (str, optional): "draft", "announcement" or "protocol", the job that
+            ran, see run_plenum() for its results. Defaults to "draft".
+    """
+    for name, result in results.items():
+        if job == "protocol" and result:
+            print(f"{name}: protocol sent")
+        elif job == "draft" and result:
+            print(f"{name}: skipped {result} unchanged page(s)")
+    for name, err in errors.items():
+        print(f"{name}: {err}", file=sys.stderr)
+    metrics.registry.count("failed_plenums", len(errors))
+
+
+def page_cache(config):
+    """
+    Returns the page cache configured in config.
+
+    Args:
+        config (Config): configuration as returned by load_config()
+
+    Returns:
+        PageCache: the page cache or None if the cache is disabled
+    """
+    if not config.page_cache:
+        return None
+    return pagecache.PageCache(config.page_cache_dir, config.page_cache_size)
+
+
+class Scheduler:
+    def __init__(self, owndir, workers=4, tick=60):
+        """
+        Constructor method for class Scheduler. The scheduler runs the draft,
+        announcement and protocol jobs of all plenums according to their
+        "schedule" setting. Wiki clients, mail sessions and compiled templates are
+        kept between the jobs. The configuration is reloaded on SIGHUP. The jobs
+        run are recorded in "scheduler_state", so a job missed while the
+        scheduler wasn't running is run once when it starts, but no job twice a day.
+
+        Args:
+            owndir (str): directory containing plenumsbot and its configuration
+            workers (int, optional): maximum number of plenums processed at the same time. Defaults to 4.
+            tick (int, optional): seconds between two checks for due jobs. Defaults to 60.
+        """
+        self.owndir = owndir
+        self.workers = workers
+        self.tick = tick
+        self.reload_requested = False
+        self.load()
+        self.last_run = self.read_state()
+
+    def load(self):
+        """ (Re)loads the configuration and sets up the wiki and mail pools """
+        config = load_config(self.owndir)
+        self.configs = config.plenums
+        self.state_file = config.scheduler_state
+        self.wikis = WikiPool(page_cache(config))
+        self.mails = MailPool()
+        metrics.registry.configure(config.metrics_log, config.metrics_textfile)
+
+    def read_state(self):
+        """
+        Returns the day every job last ran on, as recorded in the state file.
+
+        Returns:
+            dict: datetime.date of the last run, keyed by plenum name, job and
+            index of the schedule entry
+        """
+        try:
+            with open(self.state_file) as fh:
+                entries = json.load(fh)
+        except FileNotFoundError:
+            return {}
+        return {
+            (name, job, index): parse_date(date) for name, job, index, date in entries
+        }
+
+    def write_state(self):
+        """ Records the day every job last ran on in the state file """
+        entries = [
+            [name, job, index, date.strftime("%Y-%m-%d")]
+            for (name, job, index), date in sorted(self.last_run.items())
+        ]
+        tmp = f"{self.state_file}.tmp"
+        with open(tmp, "w") as fh:
+            json.dump(entries, fh, indent=4)
+        os.replace(tmp, self.state_file)
+
+    def request_reload(self, signum, frame):
+        """ Signal handler requesting a reload of the configuration """
+        self.reload_requested = True
+
+    def due_jobs(self, now=None):
+        """
+        Returns all jobs that didn't run since their latest scheduled time at or
+        before the given time, e.g. because the scheduler wasn't running. Jobs
+        that never ran are only due on their scheduled day.
+
+        A schedule entry looks like {"job": "draft", "weekday": 4, "time": "03:00"},
+        "job" is "draft", "announcement" or "protocol" and "weekday" is 0 for Monday.
+
+        Args:
+            now (datetime.datetime, optional): time to check. Defaults to the current time.
+
+        Returns:
+            list of tuple: plenum name, job and index of the schedule entry of every due job
+        """
+        now = now or datetime.datetime.now()
+        jobs = []
+        for config in self.configs:
+            name = config.name
+            for index, entry in enumerate(config.schedule):
+                job = (name, entry["job"], index)
+                due = datetime.datetime.strptime(entry["time"], "%H:%M").time()
+                date = now.date() - datetime.timedelta(
+                    (now.weekday() - entry["weekday"]) % 7
+                )
+                if date == now.date() and now.time() < due:
+                    date -= datetime.timedelta(7)
+                last_run = self.last_run.get(job)
+                if last_run is None:
+                    # no record, e.g. a new entry, don't repeat last week's job
+                    if date == now.date():
+                        jobs.append(job)
+                elif last_run < date:
+                    jobs.append(job)
+        return jobs
+
+    def run_once(self, now=None):
+        """
+        Runs all due jobs.
+
+        Args:
+            now (datetime.datetime, optional): time to check. Defaults to the current time.
+        """
+        now = now or datetime.datetime.now()
+        jobs = self.due_jobs(now)
+        for kind in ("draft", "announcement", "protocol"):
+            names = {name for name, job, _ in jobs if job == kind}
+            if not names:
+                continue
+            configs = [
+                config
+                for config in self.configs
+                if config.name in names
+            ]
+            results, errors = run_batch(
+                configs,
+                self.owndir,
+                kind == "announcement",
+                self.workers,
+                self.wikis,
+                self.mails,
+                protocol=kind == "protocol",
+            )
+            report(results, errors, kind)
+            # mail servers drop idle sessions long before the next job is due
+            self.mails.close()
+            # failed jobs are due again on the next tick
+            for job in jobs:
+                if job[1] == kind and job[0] in results:
+                    self.last_run[job] = now.date()
+        if jobs:
+            self.write_state()
+            metrics.registry.flush()
+
+    def run(self):
+        """ Runs the due jobs every tick until interrupted """
+        signal.signal(signal.SIGHUP, self.request_reload)
+        try:
+            while True:
+                if self.reload_requested:
+                    self.reload_requested = False
+                    try:
+                        self.load()
+                    except Exception as err:
+                        print(f"unable to reload config: {err}", file=sys.stderr)
+                self.run_once()
+                time.sleep(self.tick)
+        finally:
+            self.mails.close()
 
 
 if __name__ == "__main__":
@@ -467,62 +1972,157 @@ if __name__ == "__main__":
         action="store_true",
         help="Sends a reminder for the upcoming plenum.",
     )
+    parser.add_argument(
+        "--protocol",
+        action="store_true",
+        help="Sends the protocol of the last plenum once it is finished, later corrections as diff.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Number of plenums processed concurrently, if several plenums are configured.",
+    )
+    parser.add_argument(
+        "--clear-cache",
+        action="store_true",
+        help="Removes all pages from the page cache and exits.",
+    )
+    parser.add_argument(
+        "--print-dates",
+        action="store_true",
+        help="Prints the dates of the last and next plenum and exits. Doesn't access the wiki.",
+    )
+    parser.add_argument(
+        "--since",
+        type=parse_date,
+        metavar="YYYY-MM-DD",
+        help="Also creates the missing protocol drafts of all plenums since this date.",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="DIR",
+        help="Writes a cProfile profile and a tracemalloc snapshot of the whole run to DIR. "
+        "The plenums are then processed one after another.",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Keeps running and executes the jobs according to the configured schedule.",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    search_parser = subparsers.add_parser(
+        "search", help="Searches the protocols of all plenums."
+    )
+    search_parser.add_argument("query", nargs="+", help="Words to search for.")
+    search_parser.add_argument(
+        "--plenum", help="Only search the protocols of the plenum with this name."
+    )
+    search_parser.add_argument(
+        "--limit", type=int, default=20, help="Maximum number of hits. Defaults to 20."
+    )
+    search_parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Searches without updating the index from the wiki first.",
+    )
+    stats_parser = subparsers.add_parser(
+        "stats",
+        help="Prints attendance, duration, skip rate and topics per year.",
+    )
+    stats_parser.add_argument(
+        "--plenum", help="Only the statistics of the plenum with this name."
+    )
+    stats_parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Uses the stored statistics without updating them from the wiki.",
+    )
     arguments = parser.parse_args()
 
     # load configuration
     owndir = os.path.dirname(os.path.realpath(__file__))
-    config = load_config(owndir)
-    # setup plenum and wiki objects
-    plenum = Plenum(
-        config["plenum_day_of_week"],
-        config["namespace"],
-        os.path.join(owndir, "template_plenum.j2"),
-        os.path.join(owndir, "template_blank_topics.j2"),
-    )
+    if arguments.profile:
+        # the profiler only sees the main thread
+        arguments.workers = 1
+        metrics.profile(arguments.profile)
+    # the textfile is also written if the run fails
+    atexit.register(metrics.registry.flush)
+    if arguments.daemon:
+        try:
+            Scheduler(owndir, arguments.workers).run()
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
     try:
-        wiki = Wiki(
-            config["wiki_url"],
-            config["wiki_user"],
-            config["wiki_password"],
-            config["wiki_nice_url"],
-        )
-    except dokuwiki.DokuWikiError as err:
-        sys.exit(err)
-    mail = Mail(config["mail_server"], config["mail_user"], config["mail_password"])
-    if arguments.announcement:
+        config = load_config(owndir)
+    except ConfigError as err:
+        sys.exit(f"invalid configuration: {err}")
+    metrics.registry.configure(config.metrics_log, config.metrics_textfile)
+    if arguments.print_dates:
+        print_dates(config.plenums, owndir)
+        sys.exit(0)
+    cache = page_cache(config)
+    if arguments.clear_cache:
+        if cache is not None:
+            cache.invalidate()
+        sys.exit(0)
+    if arguments.command == "search":
         try:
-            collection_of_topics = wiki.get_page(plenum.next_page)
-            with open("template_mail_announcement.j2") as fh:
-                template = fh.read()
-            tpl = Template(template)
-
-            plenum_date = plenum.next_date.strftime("%Y-%m-%d")
-            announcement_message = str(
-                tpl.render(
-                    collection_of_topics=collection_of_topics,
-                    plenum_date=plenum_date,
-                    collection_link=f"{wiki.baseurl}{plenum.next_page}",
-                )
-            )
-            mail.send(
-                f"Plenumsankündigung {plenum_date}",
-                config["mail_recipient"],
-                config["mail_from"],
-                announcement_message,
+            hits = search(
+                config.plenums,
+                config.search_db,
+                WikiPool(cache),
+                " ".join(arguments.query),
+                arguments.plenum,
+                arguments.limit,
+                arguments.offline,
             )
         except Exception as err:
             sys.exit(err)
-    else:
+        for hit in hits:
+            print(f"{hit.date}  {hit.topic}  ({hit.plenum}, {hit.page})")
+            print(f"    {' '.join(hit.snippet.split())}")
+        sys.exit(0)
+    if arguments.command == "stats":
         try:
-            last_page_content = wiki.get_page(plenum.last_page)
-            index_page_content = wiki.get_page(config["indexpage"])
-            new_page_content = plenum.generate_page_next_plenum(last_page_content)
-            new_index_page_content = plenum.update_index_page(
-                index_page_content, config["namespace"]
+            stats = meeting_stats(
+                config.plenums,
+                config.stats_dir,
+                WikiPool(cache),
+                arguments.plenum,
+                arguments.offline,
             )
-            wiki.set_page(plenum.next_page, new_page_content)
-            if not plenum.plenum_in_list(index_page_content):
-                wiki.set_page(config["indexpage"], new_index_page_content)
-            wiki.set_redirect(config["redirectpage"], plenum.next_page)
         except Exception as err:
             sys.exit(err)
+
+        def fmt(value):
+            return "-" if value is None else f"{value:.1f}"
+
+        for name, years in stats.items():
+            print(name)
+            print("  year  plenums  skipped  skip rate  attendees  minutes  topics")
+            for year in years:
+                print(
+                    f"  {year.year}  {year.meetings:7}  {year.skipped:7}"
+                    f"  {year.skip_rate:9.0%}  {fmt(year.attendees):>9}"
+                    f"  {fmt(year.duration):>7}  {fmt(year.topics):>6}"
+                )
+        sys.exit(0)
+    results, errors = run_batch(
+        config.plenums,
+        owndir,
+        arguments.announcement,
+        arguments.workers,
+        WikiPool(cache),
+        since=arguments.since,
+        protocol=arguments.protocol,
+    )
+    if arguments.announcement:
+        report(results, errors, "announcement")
+    elif arguments.protocol:
+        report(results, errors, "protocol")
+    else:
+        report(results, errors)
+    if errors:
+        sys.exit(1)
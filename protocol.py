@@ -0,0 +1,206 @@
+import re
+import collections
+
+
+Event = collections.namedtuple("Event", "date, description")
+Section = collections.namedtuple("Section", "topic, contents")
+
+HEADING = re.compile(r"^={5}[^=]*={5}$")
+EVENTS_HEADING = re.compile(r"^\s*={5}\s*Termine\s*={5}\s*$", re.IGNORECASE)
+EVENT = re.compile(r"^\s{2,4}\*\s(\d{4}-\d{2}-\d{2})(.*)$")
+FIELD = re.compile(r"^(Beginn|Ende|Teilnehmer):\s*(.*?)\s*$", re.IGNORECASE)
+END_TIME = re.compile(r"^Ende:\s*\d{2}:\d{2}\s*Uhr\s*$", re.IGNORECASE)
+
+
+def iter_lines(text):
+    """
+    Yields the lines of text one by one without building a list of all lines.
+
+    Args:
+        text (str): text to be split into lines
+
+    Yields:
+        str: a single line without its line break
+    """
+    start = 0
+    length = len(text)
+    while start < length:
+        end = text.find("\n", start)
+        if end < 0:
+            end = length
+        yield text[start:end].rstrip("\r")
+        start = end + 1
+
+
+class Protocol:
+    def __init__(self, sections, events, fields, took_place, has_events=True):
+        """
+        Constructor method for class Protocol. Use Protocol.parse() to create
+        an instance from the DokuWiki source of a protocol.
+
+        Args:
+            sections (list of Section): all level 2 sections of the protocol
+            events (list of Event): all events listed below the heading "Termine"
+            fields (dict): values of "Beginn", "Ende" and "Teilnehmer", keyed by lowercase name
+            took_place (bool): True if a valid end time is set in the last two lines
+            has_events (bool, optional): True if the protocol has a section "Termine". Defaults to True.
+        """
+        self.sections = sections
+        self.events = events
+        self.fields = fields
+        self.took_place = took_place
+        self.has_events = has_events
+
+    @classmethod
+    def parse(cls, plenum_page):
+        """
+        Parses a plenum protocol in a single pass over its lines.
+
+        Args:
+            plenum_page (str): Plaintext plenum protocol (DokuWiki source)
+
+        Returns:
+            Protocol: the parsed protocol
+        """
+        sections = []
+        events = []
+        fields = {}
+        tail = collections.deque(maxlen=2)
+        in_events = False
+        # topic and lines of the section currently being read
+        topic = None
+        lines = []
+        for line in iter_lines(plenum_page):
+            tail.append(line)
+            stripped = line.strip()
+            if HEADING.match(stripped):
+                if topic is not None:
+                    # the line right before a heading is not part of the section
+                    sections.append(Section(topic, "\n".join(lines[:-1])))
+                topic = stripped.strip("=").strip()
+                lines = []
+                if not in_events and EVENTS_HEADING.match(line):
+                    in_events = True
+                continue
+            if topic is not None:
+                lines.append(line)
+            if in_events:
+                event = EVENT.match(line)
+                if event:
+                    events.append(Event(event.group(1), event.group(2)))
+                    continue
+            field = FIELD.match(line)
+            if field and field.group(1).lower() not in fields:
+                fields[field.group(1).lower()] = field.group(2)
+        if topic is not None:
+            # the last line of the page closes the last section, just like a heading
+            sections.append(Section(topic, "\n".join(lines[:-2])))
+        took_place = any(END_TIME.match(line) for line in tail)
+        return cls(sections, events, fields, took_place, in_events)
+
+    def events_after(self, date):
+        """
+        Returns all events taking place after the given date.
+
+        Args:
+            date (datetime.date): events on or before this date are dropped
+
+        Returns:
+            list of Event: events taking place after date
+        """
+        limit = date.strftime("%Y-%m-%d")
+        return [event for event in self.events if event.date > limit]
+
+
+def merge_sections(sections, more):
+    """
+    Merges the sections of several protocols, e.g. of several skipped plenums.
+    Sections with the same topic are combined, lines already present in the
+    section are not added again. The section "Termine" is dropped.
+
+    Args:
+        sections (list of Section): sections merged so far
+        more (list of Section): sections to add
+
+    Returns:
+        list of Section: the merged sections, in order of their first occurrence
+    """
+    merged = collections.OrderedDict(
+        (section.topic, section.contents)
+        for section in sections
+        if section.topic != "Termine"
+    )
+    for topic, contents in more:
+        if topic == "Termine":
+            continue
+        if topic not in merged:
+            merged[topic] = contents
+            continue
+        known = {line.strip() for line in merged[topic].splitlines()}
+        new = [
+            line
+            for line in contents.splitlines()
+            if line.strip() and line.strip() not in known
+        ]
+        if new:
+            merged[topic] = "\n".join([merged[topic].rstrip("\n")] + new)
+    return [Section(topic, contents) for topic, contents in merged.items()]
+
+
+Changes = collections.namedtuple("Changes", "versions, removed, changed")
+
+
+def protocol_changes(wiki, namespace, known):
+    """
+    Compares the protocol pages in namespace with the versions a store has read
+    before, so the store only has to download the new and changed protocols.
+
+    Args:
+        wiki (Wiki): wiki the protocols are stored in
+        namespace (str): DokuWiki namespace in which the protocol pages are located
+        known (dict): version of every protocol read before, keyed by page name
+
+    Raises:
+        err: exceptions that occurred while accessing the wiki
+
+    Returns:
+        Changes: the current version of every protocol, the known protocols
+        deleted from the wiki and the new or changed protocols
+    """
+    protocol_page = re.compile(re.escape(namespace) + r":\d{4}-\d{2}-\d{2}$")
+    versions = {
+        entry["id"]: entry.get("rev") or entry.get("mtime")
+        for entry in wiki.list_pages(namespace)
+        if protocol_page.match(entry["id"])
+    }
+    removed = set(known) - set(versions)
+    changed = [page for page in versions if known.get(page) != versions[page]]
+    return Changes(versions, removed, changed)
+
+
+def batches(pages, batch_size):
+    """ Splits pages into lists of at most batch_size pages """
+    return [
+        pages[start : start + batch_size] for start in range(0, len(pages), batch_size)
+    ]
+
+
+def read_protocols(wiki, pages):
+    """
+    Downloads and parses several protocols in one request. The page cache is
+    bypassed, the stores keep what they need of every protocol themselves.
+
+    Args:
+        wiki (Wiki): wiki the protocols are stored in
+        pages (list of str): DokuWiki page names of the protocols
+
+    Raises:
+        err: exceptions that occurred while accessing the wiki
+
+    Returns:
+        list of tuple: page name, date (YYYY-MM-DD) and Protocol of every page
+    """
+    return [
+        (page, page.rpartition(":")[2], Protocol.parse(content))
+        for page, content in zip(pages, wiki.get_pages(pages, cached=False))
+    ]
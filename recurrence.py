@@ -0,0 +1,195 @@
+import bisect
+import datetime
+
+
+WEEKDAYS = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+
+
+def parse_date(value):
+    """ Returns the datetime.date for a string formatted as YYYY-MM-DD """
+    return datetime.datetime.strptime(value, "%Y-%m-%d").date()
+
+
+class Recurrence:
+    def __init__(self, rule, start=None, exclude=(), horizon=730, today=None):
+        """
+        Constructor method for class Recurrence. A recurrence describes the dates
+        a plenum takes place on. It understands the following subset of RFC 5545
+        recurrence rules:
+
+            FREQ=WEEKLY;BYDAY=TH              every Thursday
+            FREQ=WEEKLY;INTERVAL=2;BYDAY=TH   every other Thursday, counted from start
+            FREQ=MONTHLY;BYDAY=1TH            first Thursday of the month
+            FREQ=MONTHLY;BYDAY=1TH,-1TH       first and last Thursday of the month
+
+        The dates are precomputed from start to today + horizon into a sorted table.
+
+        Args:
+            rule (str): recurrence rule
+            start (datetime.date, optional): first possible date. Required if INTERVAL
+                is greater than 1. Defaults to 2000-01-01.
+            exclude (list of str, optional): dates without plenum, either "YYYY-MM-DD" or a
+                range "YYYY-MM-DD..YYYY-MM-DD", e.g. holidays or the summer break. Defaults to ().
+            horizon (int, optional): days after today the table covers. Defaults to 730.
+            today (datetime.date, optional): Defaults to datetime.date.today().
+
+        Raises:
+            ValueError: the rule is invalid or not supported
+        """
+        parts = dict(part.split("=", 1) for part in rule.upper().split(";") if part)
+        self.freq = parts.get("FREQ")
+        if self.freq not in ("WEEKLY", "MONTHLY"):
+            raise ValueError(f"unsupported recurrence frequency: {self.freq}")
+        self.interval = int(parts.get("INTERVAL", 1))
+        if self.interval > 1 and start is None:
+            raise ValueError("a recurrence with INTERVAL needs a start date")
+        self.byday = []
+        for day in parts.get("BYDAY", "").split(","):
+            if day[-2:] not in WEEKDAYS:
+                raise ValueError(f"invalid weekday in recurrence: {day}")
+            ordinal = int(day[:-2]) if day[:-2] else None
+            self.byday.append((ordinal, WEEKDAYS.index(day[-2:])))
+        self.start = start or datetime.date(2000, 1, 1)
+        self.excluded = set()
+        self.excluded_ranges = []
+        for entry in exclude:
+            if ".." in entry:
+                first, last = entry.split("..", 1)
+                self.excluded_ranges.append((parse_date(first), parse_date(last)))
+            else:
+                self.excluded.add(parse_date(entry))
+        self.horizon = datetime.timedelta(horizon)
+        self.end = None
+        self.table = []
+        self._build(
+            (today or datetime.date.today()) + max(self.horizon, datetime.timedelta(366))
+        )
+
+    @classmethod
+    def weekly(cls, day_of_week, **kwargs):
+        """
+        Returns a recurrence taking place every week on day_of_week.
+
+        Args:
+            day_of_week (int): Number between 0-6; 0=Monday, 1=Tuesday, ..., 6=Sunday
+
+        Returns:
+            Recurrence: the weekly recurrence
+        """
+        return cls(f"FREQ=WEEKLY;BYDAY={WEEKDAYS[day_of_week]}", **kwargs)
+
+    def _is_excluded(self, date):
+        """ Returns True if no plenum takes place on date """
+        if date in self.excluded:
+            return True
+        return any(first <= date <= last for first, last in self.excluded_ranges)
+
+    def _occurrences(self, end):
+        """ Yields all dates from self.start to end, ignoring the exclusions """
+        if self.freq == "WEEKLY":
+            week = self.start - datetime.timedelta(self.start.weekday())
+            step = datetime.timedelta(weeks=self.interval)
+            while week <= end:
+                for _, weekday in sorted(self.byday, key=lambda day: day[1]):
+                    date = week + datetime.timedelta(weekday)
+                    if self.start <= date <= end:
+                        yield date
+                week += step
+            return
+        year, month = self.start.year, self.start.month
+        while datetime.date(year, month, 1) <= end:
+            dates = set()
+            for ordinal, weekday in self.byday:
+                days = self._weekdays_of_month(year, month, weekday)
+                if ordinal is None:
+                    dates.update(days)
+                elif -len(days) <= ordinal <= len(days) and ordinal != 0:
+                    dates.add(days[ordinal - 1 if ordinal > 0 else ordinal])
+            for date in sorted(dates):
+                if self.start <= date <= end:
+                    yield date
+            month += self.interval
+            year += (month - 1) // 12
+            month = (month - 1) % 12 + 1
+
+    @staticmethod
+    def _weekdays_of_month(year, month, weekday):
+        """ Returns all dates in the given month falling on weekday """
+        first = datetime.date(year, month, 1)
+        date = first + datetime.timedelta((weekday - first.weekday()) % 7)
+        days = []
+        while date.month == month:
+            days.append(date)
+            date += datetime.timedelta(7)
+        return days
+
+    def _build(self, end):
+        """ Precomputes the table of all plenum dates up to end """
+        self.table = [
+            date for date in self._occurrences(end) if not self._is_excluded(date)
+        ]
+        self.end = end
+
+    def _ensure(self, date):
+        """ Extends the table if it doesn't reach a year beyond date """
+        if date + datetime.timedelta(366) > self.end:
+            self._build(date + max(self.horizon, datetime.timedelta(366)))
+
+    def next(self, today):
+        """
+        Returns the date of the first plenum after today.
+
+        Args:
+            today (datetime.date): reference date
+
+        Raises:
+            ValueError: no plenum is scheduled after today
+
+        Returns:
+            datetime.date: date of the next plenum
+        """
+        self._ensure(today)
+        index = bisect.bisect_right(self.table, today)
+        # exclusions may be longer than the table, there is a date after the last one
+        last_excluded = max((last for _, last in self.excluded_ranges), default=today)
+        while index == len(self.table) and self.end <= max(today, last_excluded):
+            self._build(self.end + max(self.horizon, datetime.timedelta(366)))
+            index = bisect.bisect_right(self.table, today)
+        if index == len(self.table):
+            raise ValueError(f"no plenum scheduled after {today}")
+        return self.table[index]
+
+    def last(self, today):
+        """
+        Returns the date of the last plenum on or before today.
+
+        Args:
+            today (datetime.date): reference date
+
+        Raises:
+            ValueError: no plenum took place on or before today
+
+        Returns:
+            datetime.date: date of the last plenum
+        """
+        self._ensure(today)
+        index = bisect.bisect_right(self.table, today)
+        if index == 0:
+            raise ValueError(f"no plenum scheduled on or before {today}")
+        return self.table[index - 1]
+
+    def between(self, first, last):
+        """
+        Returns the dates of all plenums from first to last, both included.
+
+        Args:
+            first (datetime.date): first date of the period
+            last (datetime.date): last date of the period
+
+        Returns:
+            list of datetime.date: the sorted plenum dates
+        """
+        self._ensure(last)
+        return self.table[
+            bisect.bisect_left(self.table, first) : bisect.bisect_right(self.table, last)
+        ]
@@ -0,0 +1,128 @@
+import sqlite3
+import collections
+import concurrent.futures
+from protocol import batches, protocol_changes, read_protocols
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (page TEXT PRIMARY KEY, plenum TEXT, version INTEGER);
+CREATE VIRTUAL TABLE IF NOT EXISTS sections USING fts5(
+    page UNINDEXED, plenum UNINDEXED, date UNINDEXED, topic, contents,
+    tokenize = "unicode61 remove_diacritics 2"
+);
+"""
+
+Hit = collections.namedtuple("Hit", "plenum, date, page, topic, snippet")
+
+
+class SearchIndex:
+    def __init__(self, path):
+        """
+        Constructor method for class SearchIndex. The index is a SQLite FTS5
+        full-text index over the sections of all protocols. Every section is
+        indexed with its topic and contents, so hits point to the discussed topic.
+
+        Args:
+            path (str): file name of the SQLite database
+
+        Raises:
+            sqlite3.OperationalError: sqlite is built without FTS5
+        """
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        """ Closes the database """
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def sync(self, client, namespace, plenum=None, workers=4, batch_size=50):
+        """
+        Indexes all protocols in namespace that changed since the last sync. The
+        protocols are downloaded in batches by several clients in parallel.
+
+        Args:
+            client (callable): returns a context manager providing a Wiki client, see WikiPool.client()
+            namespace (str): DokuWiki namespace in which the protocol pages are located
+            plenum (str, optional): name of the plenum stored with the hits. Defaults to namespace.
+            workers (int, optional): maximum number of parallel downloads. Defaults to 4.
+            batch_size (int, optional): number of pages fetched per request. Defaults to 50.
+
+        Raises:
+            err: exceptions that occurred while accessing the wiki
+
+        Returns:
+            int: number of protocols indexed
+        """
+        plenum = plenum or namespace
+        known = dict(
+            self.db.execute(
+                "SELECT page, version FROM pages WHERE plenum = ?", (plenum,)
+            )
+        )
+        with client() as wiki:
+            versions, removed, changed = protocol_changes(wiki, namespace, known)
+
+        def fetch(pages):
+            with client() as wiki:
+                return read_protocols(wiki, pages)
+
+        with self.db:
+            for page in removed:
+                self._forget(page)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+                # the database is only written from this thread
+                for protocols in pool.map(fetch, batches(changed, batch_size)):
+                    for page, date, protocol in protocols:
+                        self._forget(page)
+                        self.db.executemany(
+                            "INSERT INTO sections VALUES (?, ?, ?, ?, ?)",
+                            [
+                                (page, plenum, date, section.topic, section.contents)
+                                for section in protocol.sections
+                            ],
+                        )
+                        self.db.execute(
+                            "INSERT INTO pages VALUES (?, ?, ?)",
+                            (page, plenum, versions[page]),
+                        )
+        return len(changed)
+
+    def _forget(self, page):
+        """ Removes a protocol from the index """
+        self.db.execute("DELETE FROM sections WHERE page = ?", (page,))
+        self.db.execute("DELETE FROM pages WHERE page = ?", (page,))
+
+    def search(self, query, plenum=None, limit=20):
+        """
+        Searches the sections containing all words of query.
+
+        Args:
+            query (str): words to search for
+            plenum (str, optional): only search the protocols of this plenum. Defaults to None (all).
+            limit (int, optional): maximum number of hits. Defaults to 20.
+
+        Returns:
+            list of Hit: the best matching sections first
+        """
+        # quote every word, so the query can't contain FTS5 operators
+        words = ['"' + word.replace('"', '""') + '"' for word in query.split()]
+        if not words:
+            return []
+        sql = (
+            "SELECT plenum, date, page, topic, "
+            "snippet(sections, 4, '[', ']', ' … ', 12) FROM sections "
+            "WHERE sections MATCH ?"
+        )
+        parameters = [" ".join(words)]
+        if plenum is not None:
+            sql += " AND plenum = ?"
+            parameters.append(plenum)
+        # matches in the topic count twice as much as matches in the contents
+        sql += " ORDER BY bm25(sections, 0, 0, 0, 2.0, 1.0), date DESC LIMIT ?"
+        parameters.append(limit)
+        return [Hit(*row) for row in self.db.execute(sql, parameters)]
@@ -0,0 +1,315 @@
+import os
+import re
+import json
+import functools
+from recurrence import Recurrence, parse_date
+
+ENV_PREFIX = "PLENUMSBOT_"
+LAYERS = ["config.json", "config.local.json"]
+TIME = re.compile(r"^\d{1,2}:\d{2}$")
+JOBS = ("draft", "announcement", "protocol")
+# marks the settings every plenum has to define
+REQUIRED = object()
+
+# name, accepted types and default of every setting
+FIELDS = [
+    ("name", (str,), None),  # defaults to the namespace
+    ("wiki_url", (str,), REQUIRED),
+    ("wiki_user", (str,), REQUIRED),
+    ("wiki_password", (str,), REQUIRED),
+    ("wiki_nice_url", (str,), "none"),
+    ("wiki_timeout", (int, float), 30),
+    ("wiki_retries", (int,), 2),
+    ("wiki_hedge_after", (int, float), None),
+    ("namespace", (str,), REQUIRED),
+    ("indexpage", (str,), REQUIRED),
+    ("redirectpage", (str,), REQUIRED),
+    ("plenum_day_of_week", (int,), None),  # required without recurrence
+    ("recurrence", (str,), None),
+    ("recurrence_start", (str,), None),
+    ("recurrence_exclude", (list,), ()),
+    ("recurrence_horizon", (int,), 730),
+    ("write_retries", (int,), 3),
+    ("events_db", (str,), None),
+    ("events_ics", (str,), None),
+    ("mail_server", (str,), None),
+    ("mail_port", (int,), 587),
+    ("mail_user", (str,), None),
+    ("mail_password", (str,), None),
+    ("mail_tls", (bool,), True),
+    ("mail_starttls", (bool,), True),
+    ("mail_from", (str,), None),
+    ("mail_recipient", (str, list), None),
+    ("announcement_max_size", (int,), 100000),
+    ("protocol_state", (str,), "protocol_state.json"),
+    ("schedule", (list,), ()),
+    ("scheduler_state", (str,), "scheduler_state.json"),
+    ("page_cache", (bool,), True),
+    ("page_cache_dir", (str,), "cache"),
+    ("page_cache_size", (int,), 10 * 1024 * 1024),
+    ("search_db", (str,), "search.db"),
+    ("search_workers", (int,), 4),
+    ("stats_dir", (str,), "stats"),
+    ("metrics_log", (str,), None),
+    ("metrics_textfile", (str,), None),
+]
+# settings whose default is a path relative to the directory of plenumsbot
+PATHS = {
+    "protocol_state",
+    "scheduler_state",
+    "page_cache_dir",
+    "search_db",
+    "stats_dir",
+}
+FIELDS_BY_NAME = {name: (types, default) for name, types, default in FIELDS}
+
+
+class ConfigError(ValueError):
+    """ Raised if the configuration is invalid, lists all problems found """
+
+
+class Settings:
+    __slots__ = tuple(name for name, _, _ in FIELDS)
+
+    def __init__(self, values, owndir, required=True):
+        """
+        Constructor method for class Settings. Holds the validated settings of one
+        plenum, missing settings get their default. The object is shared between
+        all jobs using the same configuration and mustn't be modified.
+
+        Args:
+            values (dict): settings as read from the configuration files
+            owndir (str): directory the default paths are relative to
+            required (bool, optional): check that the settings of a plenum are complete. Defaults to True.
+
+        Raises:
+            ConfigError: unknown settings, wrong types or missing required settings
+        """
+        problems = [
+            f"unknown setting {key!r}" for key in values if key not in FIELDS_BY_NAME
+        ]
+        for name, types, default in FIELDS:
+            if name not in values or values[name] is None:
+                if default is REQUIRED and required:
+                    problems.append(f"{name!r} is missing")
+                if default is REQUIRED:
+                    default = None
+                elif name in PATHS:
+                    default = os.path.join(owndir, default)
+                setattr(self, name, default)
+                continue
+            value = values[name]
+            # bool is a subclass of int, but true isn't a valid port
+            if not isinstance(value, types) or (
+                isinstance(value, bool) and bool not in types
+            ):
+                expected = " or ".join(kind.__name__ for kind in types)
+                problems.append(f"{name!r} must be {expected}, not {value!r}")
+            setattr(self, name, value)
+        if self.name is None:
+            self.name = self.namespace
+        if required and self.plenum_day_of_week is None and self.recurrence is None:
+            problems.append("'plenum_day_of_week' or 'recurrence' is missing")
+        if not problems:
+            problems = self._check()
+        if problems:
+            raise ConfigError("; ".join(problems))
+
+    def _check(self):
+        """ Returns the problems of settings with the right type but a bad value """
+        problems = []
+        if (
+            self.plenum_day_of_week is not None
+            and not 0 <= self.plenum_day_of_week <= 6
+        ):
+            problems.append("'plenum_day_of_week' must be between 0 (Monday) and 6")
+        if all(isinstance(entry, str) for entry in self.recurrence_exclude):
+            try:
+                start = self.recurrence_start and parse_date(self.recurrence_start)
+                if self.recurrence is not None:
+                    Recurrence(self.recurrence, start, self.recurrence_exclude, 0)
+                else:
+                    for entry in self.recurrence_exclude:
+                        for date in entry.split("..", 1):
+                            parse_date(date)
+            except ValueError as err:
+                problems.append(f"invalid recurrence: {err}")
+        else:
+            problems.append("'recurrence_exclude' must only contain str")
+        for index, entry in enumerate(self.schedule):
+            if (
+                not isinstance(entry, dict)
+                or entry.get("job") not in JOBS
+                or entry.get("weekday") not in range(7)
+                or not TIME.match(str(entry.get("time")))
+            ):
+                problems.append(
+                    f"schedule entry {index} must look like "
+                    '{"job": "draft", "weekday": 4, "time": "03:00"}'
+                )
+        return problems
+
+    def __repr__(self):
+        return f"<Settings {self.name!r}>"
+
+
+class Config(Settings):
+    __slots__ = ("plenums",)
+
+    def __init__(self, values, owndir):
+        """
+        Constructor method for class Config. Holds the validated top level
+        settings and the Settings of every plenum. Every entry of the list
+        "plenums" is merged on top of the top level settings, so entries only
+        have to contain the values that differ between the groups. Without a list
+        "plenums" the top level settings describe the only plenum.
+
+        Args:
+            values (dict): merged layers of the configuration
+            owndir (str): directory the default paths are relative to
+
+        Raises:
+            ConfigError: the configuration of a plenum is invalid
+        """
+        values = dict(values)
+        groups = values.pop("plenums", None)
+        super().__init__(values, owndir, required=groups is None)
+        if groups is None:
+            self.plenums = [Settings(values, owndir)]
+            return
+        if not isinstance(groups, list) or not groups:
+            raise ConfigError("'plenums' must be a non-empty list")
+        self.plenums = []
+        for index, group in enumerate(groups):
+            try:
+                self.plenums.append(Settings({**values, **group}, owndir))
+            except (ConfigError, TypeError) as err:
+                raise ConfigError(f"plenums[{index}]: {err}") from None
+        names = [plenum.name for plenum in self.plenums]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            raise ConfigError(f"plenum names must be unique: {', '.join(duplicates)}")
+
+
+def group_key(group):
+    """ Returns the key entries of "plenums" are merged by, their name or namespace """
+    if not isinstance(group, dict):
+        return None
+    return group.get("name") or group.get("namespace")
+
+
+def merge(base, layer):
+    """
+    Returns base with the values of layer merged on top. Dicts are merged
+    recursively, entries of "plenums" are merged with the entry of the same
+    name, other values are replaced.
+
+    Args:
+        base (dict): lower configuration layer
+        layer (dict): higher configuration layer
+
+    Returns:
+        dict: the merged layers, base and layer are left unchanged
+    """
+    merged = dict(base)
+    for key, value in layer.items():
+        if (
+            key == "plenums"
+            and isinstance(merged.get(key), list)
+            and isinstance(value, list)
+        ):
+            groups = list(merged[key])
+            keys = [group_key(group) for group in groups]
+            for group in value:
+                if group_key(group) is not None and group_key(group) in keys:
+                    index = keys.index(group_key(group))
+                    groups[index] = merge(groups[index], group)
+                else:
+                    groups.append(group)
+            merged[key] = groups
+        elif isinstance(merged.get(key), dict) and isinstance(value, dict):
+            merged[key] = merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def environment_layer(environ):
+    """
+    Returns the settings given as environment variables, like
+    PLENUMSBOT_WIKI_PASSWORD. Values are parsed as JSON if possible, so
+    PLENUMSBOT_MAIL_PORT=465 is a number and other values are strings.
+
+    Args:
+        environ (dict): environment variables
+
+    Returns:
+        dict: the settings
+    """
+    layer = {}
+    for key, value in environ.items():
+        name = key[len(ENV_PREFIX) :].lower()
+        if not key.startswith(ENV_PREFIX) or name not in FIELDS_BY_NAME:
+            continue
+        try:
+            layer[name] = json.loads(value)
+        except ValueError:
+            layer[name] = value
+    return layer
+
+
+def load_config(owndir, environ=None):
+    """
+    Returns the configuration of plenumsbot. config.json is required,
+    config.local.json (e.g. for the passwords) and environment variables are
+    merged on top, in this order; the environment variables also override the
+    settings of every plenum. The compiled configuration is kept until one of
+    the files or the environment changes.
+
+    Args:
+        owndir (str): directory containing the configuration files
+        environ (dict, optional): environment variables. Defaults to os.environ.
+
+    Raises:
+        ConfigError: a file is no valid JSON or the configuration is invalid
+
+    Returns:
+        Config: the validated configuration
+    """
+    versions = []
+    for layer in LAYERS:
+        path = os.path.join(owndir, layer)
+        try:
+            versions.append((path, os.stat(path).st_mtime_ns))
+        except FileNotFoundError:
+            if layer == LAYERS[0]:
+                raise
+    environ = os.environ if environ is None else environ
+    variables = tuple(
+        sorted(
+            (key, value) for key, value in environ.items() if key.startswith(ENV_PREFIX)
+        )
+    )
+    return _compile(owndir, tuple(versions), variables)
+
+
+@functools.lru_cache(maxsize=8)
+def _compile(owndir, versions, variables):
+    """ Reads, merges and validates the layers, cached by modification times """
+    values = {}
+    for path, _ in versions:
+        with open(path, "r") as fh:
+            try:
+                layer = json.load(fh)
+            except ValueError as err:
+                raise ConfigError(f"{path}: {err}") from None
+        if not isinstance(layer, dict):
+            raise ConfigError(f"{path}: must contain a JSON object")
+        values = merge(values, layer)
+    environment = environment_layer(dict(variables))
+    if isinstance(values.get("plenums"), list):
+        values["plenums"] = [
+            merge(group, environment) if isinstance(group, dict) else group
+            for group in values["plenums"]
+        ]
+    return Config(merge(values, environment), owndir)
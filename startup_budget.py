@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+# libraries only needed when the wiki or the mailserver are accessed
+NETWORK_MODULES = {
+    "dokuwiki",
+    "jinja2",
+    "smtplib",
+    "xmlrpc.client",
+    "email.message",
+    "concurrent.futures",
+}
+
+
+def measure_import(owndir, module="plenumsbot"):
+    """
+    Imports module in a fresh interpreter with "python -X importtime".
+
+    Args:
+        owndir (str): directory containing the module
+        module (str, optional): module to import. Defaults to "plenumsbot".
+
+    Returns:
+        tuple: cumulative import time of module in milliseconds and the set of all imported modules
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=owndir,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    cumulative = 0
+    modules = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:") :].split("|")
+        modules.add(name.strip())
+        if name.strip() == module:
+            cumulative = int(cumulative_us) / 1000
+    return cumulative, modules
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Checks that importing plenumsbot stays within its startup budget"
+    )
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=60,
+        help="Maximum median import time in milliseconds. Defaults to 60.",
+    )
+    parser.add_argument(
+        "--runs", type=int, default=5, help="Number of measurements. Defaults to 5."
+    )
+    arguments = parser.parse_args()
+
+    owndir = os.path.dirname(os.path.realpath(__file__))
+    # the first import writes the bytecode files, don't count it
+    measure_import(owndir)
+    timings = []
+    imported = set()
+    for _ in range(arguments.runs):
+        timing, modules = measure_import(owndir)
+        timings.append(timing)
+        imported |= modules
+    median = statistics.median(timings)
+    print(f"import plenumsbot: {median:.1f} ms (budget {arguments.budget:.1f} ms)")
+    failed = False
+    eager = sorted(NETWORK_MODULES & imported)
+    if eager:
+        print(f"imported at startup: {', '.join(eager)}")
+        failed = True
+    if median > arguments.budget:
+        print("startup budget exceeded")
+        failed = True
+    sys.exit(1 if failed else 0)
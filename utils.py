@@ -1,3 +1,6 @@
+import importlib
+
+
 def join_url(fragments, trailing_slash=False):
     """
     Joins the strings from the fragments list, with slashes, avoiding
@@ -31,3 +34,21 @@ def join_url(fragments, trailing_slash=False):
     if trailing_slash and not joined[:-1] == "/":
         joined += "/"
     return joined
+
+
+class LazyModule:
+    def __init__(self, name):
+        """
+        Constructor method for class LazyModule. The module is imported on first
+        attribute access, so that every mode only pays for the libraries it uses.
+
+        Args:
+            name (str): name of the module, e.g. "email.mime.text"
+        """
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(importlib.import_module(self._name), attr)
+
+    def __repr__(self):
+        return f"<lazy module '{self._name}'>"